@@ -1,16 +1,13 @@
-import mplsoccer
+import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt, gridspec
-import math
-import statistics
 from scipy.ndimage import gaussian_filter
-from preprocess_data import pitch
+from preprocess_data import get_metadata, pitch
+import export
+import match_store
+import occupancy
+import render
 import os
 
-# ball and player
-player_df = pd.read_csv("data/player.csv")
-ball_df = pd.read_csv("data/ball.csv")
-
 # pitch details
 pitch_length = pitch["x"]
 pitch_width = pitch["y"]
@@ -24,78 +21,113 @@ def frame_to_time(frame_num, frame_rate, start_frame):
     return f"{minutes} minutes, {seconds} seconds"
 
 
-def remove_old_files():
-    # remove all heatmaps in the directory
+def remove_old_files(keep=()):
+    """
+    Removes the heatmaps of earlier runs from the figures directory. Rendered figures stay in the render cache, so
+    one that is needed again is copied back rather than drawn again (see render.render_figures).
+    :param keep: filenames of figures to leave in place
+    """
     dir = "figures"
 
     # Create the directory if it doesn"t exist
     os.makedirs(dir, exist_ok=True)
 
+    keep = {os.path.normpath(filename) for filename in keep}
     for f in os.listdir(dir):
-        os.remove(os.path.join(dir, f))
+        if os.path.join(dir, f) not in keep:
+            os.remove(os.path.join(dir, f))
 
 
 def distance(p1, p2, mins):
     """
     Generate distance between the average x,y of one player, and the average x,y of another
     :param mins: minutes between points
-    :param p1: player 1
-    :param p2: player 2
+    :param p1: player 1, or a group of players, as rows of the player table
+    :param p2: player 2, or a group of players
     :return: distance
     """
 
     if len(p1["x"]) == 0 or len(p1["y"]) == 0 or len(p2["x"]) == 0 or len(p2["y"]) == 0:
         return "Undefined"
 
-    # if there is more than one player in the analysis, take an average of their positions for every second
-    # max rows for one player
-    row_intervals = mins * 60
+    # if there is more than one player in the analysis, take an average of their positions for every frame,
+    # then compare the two sides over the first mins of the frames they share (one second per row)
+    distances = centroid_distances(frame_centroids(p1), frame_centroids(p2))[1][:mins * 60]
+    if len(distances) == 0:
+        return "Undefined"
 
-    p1_x_coords = []
-    p1_y_coords = []
-    p2_x_coords = []
-    p2_y_coords = []
-
-    # account for multiple groups of players
-    if len(p1) > row_intervals:
-        j = len(p1) // row_intervals
-        for i in range(0, len(p1), j):
-            temp_slice = p1.iloc[i:i + j]
-            p1_x_coords.append(statistics.mean(temp_slice["x"]))
-            p1_y_coords.append(statistics.mean(temp_slice["y"]))
-    else:
-        for i in range(0, len(p1)):
-            p1_x_coords.append(p1.iloc[i]["x"])
-            p1_y_coords.append(p1.iloc[i]["y"])
-
-    if len(p2) > row_intervals:
-        j = len(p2) // row_intervals
-        for i in range(0, len(p2), j):
-            temp_slice = p2.iloc[i:i + j]
-            p2_x_coords.append(statistics.mean(temp_slice["x"]))
-            p2_y_coords.append(statistics.mean(temp_slice["y"]))
-    else:
-        for i in range(0, len(p2)):
-            p2_x_coords.append(p2.iloc[i]["x"])
-            p2_y_coords.append(p2.iloc[i]["y"])
+    return round(float(distances.mean()), 2)
 
-    average_distance = []
 
-    for i in range(0, row_intervals):
-        if i == min(len(p1), len(p2)):
-            break
-        a = p1_x_coords[i] - p2_x_coords[i]
-        b = p1_y_coords[i] - p2_y_coords[i]
-        h = math.sqrt((a ** 2) + (b ** 2))
+def frame_centroids(rows):
+    """
+    Averages the positions of a player or a group of players in every frame.
+    :param rows: rows of the player table
+    :return: sorted frame numbers, and the mean x and mean y in each of them
+    """
+    frames, frame_index = np.unique(rows["frame_num"].to_numpy(), return_inverse=True)
+    counts = np.bincount(frame_index, minlength=len(frames))
+    x = np.bincount(frame_index, weights=rows["x"].to_numpy(dtype=np.float64), minlength=len(frames)) / counts
+    y = np.bincount(frame_index, weights=rows["y"].to_numpy(dtype=np.float64), minlength=len(frames)) / counts
+    return frames, x, y
 
-        average_distance.append(h)
 
-    mean_dist = statistics.mean(average_distance)
+def centroid_distances(centroids1, centroids2):
+    """
+    :param centroids1: output of frame_centroids for one side
+    :param centroids2: output of frame_centroids for the other side
+    :return: the frames both sides have, and the distance between the two sides in each of them
+    """
+    frames1, x1, y1 = centroids1
+    frames2, x2, y2 = centroids2
+    frames, rows1, rows2 = np.intersect1d(frames1, frames2, assume_unique=True, return_indices=True)
+    return frames, np.hypot(x1[rows1] - x2[rows2], y1[rows1] - y2[rows2])
 
-    return round(mean_dist, 2)
+
+def select_group(player_df, group):
+    """
+    :param group: list of (team_id, squadNum) of the players in the group
+    :return: rows of the player table of the players in the group
+    """
+    wanted = pd.MultiIndex.from_tuples(group, names=["team_id", "squadNum"])
+    return player_df[pd.MultiIndex.from_frame(player_df[["team_id", "squadNum"]]).isin(wanted)]
 
 
-def run_player_vs_ball_analysis(player_squad_num, team_id, distance_threshold, less_more, mins):
+def group_distances(player_df, comparisons):
+    """
+    Mean distance between groups of players, e.g. a back four and a front three, for many comparisons at once.
+    Each group is averaged per frame and each pair of groups is aligned on frame once, however many windows it
+    is compared over, and every window is then a difference of two running sums.
+    :param player_df: player table
+    :param comparisons: list of (group 1, group 2, (start_frame, end_frame)), a group being a list of
+    (team_id, squadNum) and the frames running from start_frame up to end_frame (exclusive)
+    :return: DataFrame with one row per comparison giving its start_frame, end_frame, the number of frames both
+    groups have in it and their mean_distance (NaN if there are none)
+    """
+    centroids = {}
+    pairs = {}
+    results = []
+
+    for group1, group2, (start_frame, end_frame) in comparisons:
+        key = (tuple(group1), tuple(group2))
+        if key not in pairs:
+            for group in key:
+                if group not in centroids:
+                    centroids[group] = frame_centroids(select_group(player_df, group))
+            frames, distances = centroid_distances(centroids[key[0]], centroids[key[1]])
+            pairs[key] = (frames, np.concatenate(([0], np.cumsum(distances))))
+
+        frames, running_sum = pairs[key]
+        first, last = np.searchsorted(frames, [start_frame, end_frame])
+        count = int(last - first)
+        mean_distance = (running_sum[last] - running_sum[first]) / count if count else np.nan
+        results.append((start_frame, end_frame, count, mean_distance))
+
+    return pd.DataFrame(results, columns=["start_frame", "end_frame", "frames", "mean_distance"])
+
+
+def run_player_vs_ball_analysis(player_squad_num, team_id, distance_threshold, less_more, mins,
+                                workers=render.RENDER_WORKERS, output=export.FIGURES):
     """
     Analyses the distance between a player and the ball over time.
     :param player_squad_num: Squad number of the player
@@ -103,113 +135,224 @@ def run_player_vs_ball_analysis(player_squad_num, team_id, distance_threshold, l
     :param distance_threshold: Distance threshold for comparison
     :param less_more: Whether the distance should be less than or greater than the threshold
     :param mins: Time interval for analysis in minutes
+    :param workers: number of processes rendering the figures, see render.render_figures
+    :param output: export.FIGURES to draw a figure per window, export.ARRAYS to write the heatmaps of every window
+    to data/export/player_ball_distance_<team>_<squad>.npz, with the parameters in a .json file of the same name
     """
+    export.check_output(output)
+
     # one second per row
     row_intervals = mins * 60
 
-    # Load player and ball data
-    player_df = pd.read_csv("data/player.csv")
-    ball_df = pd.read_csv("data/ball.csv")
+    # Load player and ball data, and the size of the pitch they are on
+    player_df = match_store.load_table("player")
+    ball_df = match_store.load_table("ball")
+    pitch_length, pitch_width = get_metadata().pitch["x"], get_metadata().pitch["y"]
+
+    # Distance to the ball of the selected player in every frame, computed once for the whole match
+    player_data = player_ball_distances(player_df, ball_df, players=[(team_id, player_squad_num)])
+    x, y = player_data["x"].to_numpy(), player_data["y"].to_numpy()
+    # frames without a ball have a NaN distance, which is neither within nor beyond the threshold
+    all_distances = player_data["distance"].to_numpy()
+    if less_more == ">":
+        within = all_distances > distance_threshold
+    else:
+        within = all_distances < distance_threshold
 
-    # Filter data for the selected player and the ball
-    player_data = player_df.loc[(player_df["squadNum"] == player_squad_num) & (player_df["team_id"] == team_id)]
-    # Ball data is assumed to be in the ball_df
+    # occupancy of the player and of the ball in the player's frames, so a window's heatmap is a subtraction.
+    # A missing ball is off the pitch, so it is left out of the ball heatmap but the player's position still counts
+    key = f"{team_id}_{player_squad_num}"
+    frame_nums = player_data["frame_num"].to_numpy()
+    player_cube = occupancy.cached_cube(f"player_{key}", frame_nums, x, y, pitch_length, pitch_width)
+    ball_cube = occupancy.cached_cube(f"ball_{key}", frame_nums, player_data["x_ball"], player_data["y_ball"],
+                                      pitch_length, pitch_width)
 
+    jobs = []
     for i in range(row_intervals, len(player_data), row_intervals):
         j = i - row_intervals
-        player_slice = player_data.iloc[j:i]
-        ball_slice = ball_df.iloc[j:i]
-
-        if player_slice.empty or ball_slice.empty:
-            print(f"No data for player or ball in the interval from {j} to {i}")
-            continue
-
-        # Calculate distance between player and ball for each frame
-        distances = calculate_distances(player_slice, ball_slice)
-
-        # Create the figure with three subplots
-        fig = plt.figure(figsize=(14, 7))
-
-        # creating a grid specification object
-        gs = gridspec.GridSpec(1, 3)  # 1 row, 3 columns
-
-        # Initialise the pitch
-        pitch = mplsoccer.Pitch(pitch_type="custom", pitch_length=pitch_length, pitch_width=pitch_width, line_zorder=2,
-                                pitch_color="#22312b", line_color="#efefef")
-
-        ax1 = plt.subplot(gs[0, 0])  # Player heatmap
-        ax2 = plt.subplot(gs[0, 1])  # Ball heatmap
-        ax3 = plt.subplot(gs[0, 2])  # Distance heatmap
-
-        # Draw the pitch on each subplot
-        pitch.draw(ax=ax1)
-        pitch.draw(ax=ax2)
-        pitch.draw(ax=ax3)
-
-        # Heatmap for player
-        # calculating a 2D histogram of the player’s positions. pitch is divided into a grid of 25x25 bins
-        # the number of times the player is found in each bin is counted.
-        bin_statistic_player = pitch.bin_statistic(player_slice["x"], player_slice["y"], statistic="count",
-                                                   bins=(25, 25))
-        # applying a Gaussian filter to the 2D histogram.
-        # smooths the data, highlighting trends in the player’s position over time.
-        bin_statistic_player["statistic"] = gaussian_filter(bin_statistic_player["statistic"], 1)
-
-        # creating a heatmap from the smoothed 2D histogram.
-        # heatmap plotted on the subplot ax1, with a hot colormap (higher values are  warmer colors), edge colours dark green
-        pitch.heatmap(bin_statistic_player, ax=ax1, cmap="hot", edgecolors="#22312b")
-
-        # Heatmap for ball
-        bin_statistic_ball = pitch.bin_statistic(ball_slice["x"], ball_slice["y"], statistic="count", bins=(25, 25))
-        bin_statistic_ball["statistic"] = gaussian_filter(bin_statistic_ball["statistic"], 1)
-        pitch.heatmap(bin_statistic_ball, ax=ax2, cmap="hot", edgecolors="#22312b")
-
-        print("Length of player_slice:", len(player_slice))
-        print("Length of distances:", len(distances))
-
-        # Initialise relevant_positions outside the inner loop
-        relevant_positions = []
-
-        counter = 0  # Initialise a counter to align with the distances list
-        for index, row in player_slice.iterrows():
-            if counter >= len(distances):
-                print("Counter exceeds length of distances list:", counter)
-                break
-
-            # Distance heatmap
-            # Determine player positions within the specified distance from the ball
-            # uses counter to access elements in distances
-            if ((less_more == ">" and distances[counter] > distance_threshold) or
-                    (less_more == "<" and distances[counter] < distance_threshold)):
-                relevant_positions.append((row["x"], row["y"]))
-
-            counter += 1  # Increment the counter
-
-        # Convert to DataFrame for easier processing
-        relevant_positions_df = pd.DataFrame(relevant_positions, columns=["x", "y"])
-
-        # Create a heatmap for these positions
-        if not relevant_positions_df.empty:
-            bin_statistic_distance = mplsoccer.Pitch().bin_statistic(relevant_positions_df["x"],
-                                                                     relevant_positions_df["y"], statistic="count",
-                                                                     bins=(25, 25))
-            bin_statistic_distance["statistic"] = gaussian_filter(bin_statistic_distance["statistic"], 1)
-            mplsoccer.Pitch().heatmap(bin_statistic_distance, ax=ax3, cmap="hot", edgecolors="#22312b")
-            ax3.set_title("Player's Positions Within Specified Distance from Ball")
-        else:
-            ax3.text(0.5, 0.5, "No Data within Specified Distance", horizontalalignment="center",
-                     verticalalignment="center", transform=ax3.transAxes)
-
-        # Add titles
-        ax1.set_title("Player Movement")
-        ax2.set_title("Ball Movement")
-        ax3.set_title(f"Player's Positions Within Specified {distance_threshold} metre/s from Ball")
-
-        # Save the figure
-        fig.savefig(f"figures/player_ball_distance_{j // 60}_{i // 60}.png")
-
-        plt.close(fig)
-        print("Done.")
+
+        # Player positions within the specified distance from the ball, sliced from the precomputed arrays
+        distance_heatmap = None
+        if within[j:i].any():
+            distance_counts = occupancy.bin_counts(x[j:i][within[j:i]], y[j:i][within[j:i]], pitch_length,
+                                                   pitch_width)
+            distance_heatmap = gaussian_filter(distance_counts.astype(float), 1)
+
+        # heatmaps of the player and the ball: the number of times each is found in each of 25x25 bins,
+        # read off the occupancy cubes and smoothed with a Gaussian filter to highlight trends over time
+        jobs.append({"filename": f"figures/player_ball_distance_{j // 60}_{i // 60}.png",
+                     "pitch_length": pitch_length, "pitch_width": pitch_width,
+                     "player_heatmap": player_cube.smoothed(j, i), "ball_heatmap": ball_cube.smoothed(j, i),
+                     "distance_heatmap": distance_heatmap, "distance_threshold": distance_threshold})
+
+    if output == export.ARRAYS:
+        # one (25, 25) heatmap per window, NaN for the windows without positions within the threshold
+        def heatmaps(name):
+            blank = np.full((occupancy.BINS, occupancy.BINS), np.nan)
+            return np.array([blank if job[name] is None else job[name] for job in jobs]).reshape(
+                -1, occupancy.BINS, occupancy.BINS)
+
+        starts = np.arange(len(jobs)) * mins
+        x_edges, y_edges = occupancy.bin_edges(pitch_length, pitch_width)
+        name = f"player_ball_distance_{key}"
+        arrays = export.write_arrays(name, start_minute=starts, end_minute=starts + mins, x_edges=x_edges,
+                                     y_edges=y_edges, player=heatmaps("player_heatmap"),
+                                     ball=heatmaps("ball_heatmap"), distance=heatmaps("distance_heatmap"))
+        export.write_json(name, {"player_squad_num": player_squad_num, "team_id": team_id,
+                                 "distance_threshold": distance_threshold, "less_more": less_more, "mins": mins,
+                                 "windows": len(jobs), "arrays": arrays})
+    else:
+        remove_old_files(keep=[job["filename"] for job in jobs])
+        render.render_figures("plots.player_vs_ball_window", jobs, workers)
+    print("Done.")
+
+
+def ball_positions(player_frames, ball_data):
+    """
+    Finds the ball in the frame of each player row.
+    :param player_frames: frame numbers of the player rows
+    :param ball_data: DataFrame containing ball positions, one row per frame
+    :return: x and y of the ball for each player row (NaN where the ball is missing from the frame)
+    """
+    player_frames = np.asarray(player_frames)
+    if len(ball_data) == 0:
+        return np.full(len(player_frames), np.nan), np.full(len(player_frames), np.nan)
+    if not ball_data["frame_num"].is_monotonic_increasing:
+        ball_data = ball_data.sort_values(by="frame_num")
+
+    ball_frames = ball_data["frame_num"].to_numpy()
+    rows = np.minimum(np.searchsorted(ball_frames, player_frames), len(ball_frames) - 1)
+    found = ball_frames[rows] == player_frames
+
+    ball_x = np.where(found, ball_data["x"].to_numpy(dtype=np.float64)[rows], np.nan)
+    ball_y = np.where(found, ball_data["y"].to_numpy(dtype=np.float64)[rows], np.nan)
+    return ball_x, ball_y
+
+
+def player_ball_distances(player_df, ball_df, players=None):
+    """
+    Distance from players to the ball in every frame, joining the player and ball tables on frame_num.
+    :param player_df: DataFrame of player positions
+    :param ball_df: DataFrame of ball positions
+    :param players: optional list of (team_id, squadNum) of the players wanted, defaults to every player
+    :return: DataFrame of every player row, with the ball position added as x_ball and y_ball and the distance
+    between them as distance, all three NaN where the frame has no ball
+    """
+    if players is not None:
+        wanted = pd.MultiIndex.from_tuples(players, names=["team_id", "squadNum"])
+        player_df = player_df[pd.MultiIndex.from_frame(player_df[["team_id", "squadNum"]]).isin(wanted)]
+
+    ball_x, ball_y = ball_positions(player_df["frame_num"], ball_df)
+
+    distances = player_df.reset_index(drop=True)
+    distances["x_ball"] = ball_x
+    distances["y_ball"] = ball_y
+    distances["distance"] = np.hypot(distances["x"].to_numpy(dtype=np.float64) - distances["x_ball"].to_numpy(),
+                                     distances["y"].to_numpy(dtype=np.float64) - distances["y_ball"].to_numpy())
+    return distances
+
+
+def influence_table(distances, distance_threshold, mins, seconds_per_row=1):
+    """
+    Player Influence for every player at once: the time each player spends within and beyond a distance of the ball
+    in each window, with their mean and median distance from it.
+    Like run_player_vs_ball_analysis, each player's windows are consecutive runs of mins * 60 of their rows.
+    Rows in frames without a ball count towards the windows but not towards the times and distances.
+    :param distances: output of player_ball_distances
+    :param distance_threshold: distance from the ball in metres
+    :param mins: Time interval for analysis in minutes
+    :param seconds_per_row: seconds of play each row stands for
+    :return: DataFrame with one row per player and window
+    """
+    row_intervals = int(mins * 60 / seconds_per_row)
+    players = ["team_id", "squadNum"]
+
+    distances = distances.sort_values(by=players + ["frame_num"], kind="stable")
+    distances = distances.assign(window=distances.groupby(players).cumcount() // row_intervals,
+                                 within=distances["distance"] < distance_threshold)
+
+    table = distances.groupby(players + ["window"]).agg(start_frame=("frame_num", "min"),
+                                                         end_frame=("frame_num", "max"),
+                                                         rows=("distance", "size"),
+                                                         rows_measured=("distance", "count"),
+                                                         rows_within=("within", "sum"),
+                                                         mean_distance=("distance", "mean"),
+                                                         median_distance=("distance", "median")).reset_index()
+
+    table["seconds_within"] = table["rows_within"] * seconds_per_row
+    table["seconds_beyond"] = (table["rows_measured"] - table["rows_within"]) * seconds_per_row
+    return table.drop(columns=["rows_measured", "rows_within"])
+
+
+def run_influence_table(distance_threshold, mins, output_file="data/influence.csv"):
+    """
+    Writes the Player Influence table of every player, see influence_table, loading the match only once.
+    :return: the table
+    """
+    player_df = match_store.load_table("player")
+    ball_df = match_store.load_table("ball")
+
+    table = influence_table(player_ball_distances(player_df, ball_df), distance_threshold, mins)
+    table.to_csv(output_file, index=False)
+    return table
+
+
+def rolling_influence(distances, distance_threshold, mins, stride_seconds=60, seconds_per_row=1):
+    """
+    Player Influence over overlapping windows: a time series per player of the time spent within and beyond a
+    distance of the ball, and the mean distance from it, in windows of mins that move on by stride_seconds.
+    Running counts of rows, distances and threshold hits are kept for the whole match, so every window is a difference
+    of two of them and the cost does not depend on how much the windows overlap.
+    Rows in frames without a ball count towards the windows but not towards the times and distances.
+    :param distances: output of player_ball_distances
+    :param distance_threshold: distance from the ball in metres
+    :param mins: length of the windows in minutes
+    :param stride_seconds: seconds between the starts of consecutive windows
+    :param seconds_per_row: seconds of play each row stands for
+    :return: DataFrame with one row per player and window, for every full window of each player
+    """
+    window = int(mins * 60 / seconds_per_row)
+    stride = max(1, int(stride_seconds / seconds_per_row))
+    players = ["team_id", "squadNum"]
+
+    distances = distances.sort_values(by=players + ["frame_num"], kind="stable").reset_index(drop=True)
+    distance = distances["distance"].to_numpy(dtype=np.float64)
+    measured = ~np.isnan(distance)
+    frame_nums = distances["frame_num"].to_numpy()
+    running_distance = np.concatenate(([0], np.cumsum(np.where(measured, distance, 0))))
+    running_measured = np.concatenate(([0], np.cumsum(measured)))
+    running_within = np.concatenate(([0], np.cumsum(distance < distance_threshold)))
+
+    # where each window of each player starts, as a row of the sorted distances
+    starts = []
+    for rows in distances.groupby(players, sort=False).indices.values():
+        starts.append(np.arange(rows[0], rows[-1] - window + 2, stride))
+    starts = np.concatenate(starts) if starts else np.array([], dtype=np.int64)
+    ends = starts + window
+
+    rows_within = running_within[ends] - running_within[starts]
+    rows_measured = running_measured[ends] - running_measured[starts]
+    table = distances.loc[starts, players].reset_index(drop=True)
+    table["start_frame"] = frame_nums[starts]
+    table["end_frame"] = frame_nums[ends - 1]
+    table["seconds_within"] = rows_within * seconds_per_row
+    table["seconds_beyond"] = (rows_measured - rows_within) * seconds_per_row
+    with np.errstate(invalid="ignore", divide="ignore"):
+        table["mean_distance"] = (running_distance[ends] - running_distance[starts]) / rows_measured
+    return table
+
+
+def run_rolling_influence(distance_threshold, mins, stride_seconds=60, output_file="data/rolling_influence.csv"):
+    """
+    Writes the rolling Player Influence of every player, see rolling_influence, loading the match only once.
+    :return: the table
+    """
+    player_df = match_store.load_table("player")
+    ball_df = match_store.load_table("ball")
+
+    table = rolling_influence(player_ball_distances(player_df, ball_df), distance_threshold, mins, stride_seconds)
+    table.to_csv(output_file, index=False)
+    return table
 
 
 def calculate_distances(player_data, ball_data):
@@ -217,13 +360,8 @@ def calculate_distances(player_data, ball_data):
     Calculate distances between player and ball for each frame.
     :param player_data: DataFrame containing player positions
     :param ball_data: DataFrame containing ball positions
-    :return: Series or list of distances
-    """
-    distances = []
-    for player_row, ball_row in zip(player_data.itertuples(), ball_data.itertuples()):
-        player_pos = (player_row.x, player_row.y)
-        ball_pos = (ball_row.x, ball_row.y)
-        # Euclidean distance between the two points
-        distance = math.sqrt((player_pos[0] - ball_pos[0]) ** 2 + (player_pos[1] - ball_pos[1]) ** 2)
-        distances.append(distance)
-    return distances
+    :return: array of the distance of each player row from the ball in the same frame (NaN where there is no ball)
+    """
+    ball_x, ball_y = ball_positions(player_data["frame_num"], ball_data)
+    return np.hypot(player_data["x"].to_numpy(dtype=np.float64) - ball_x,
+                    player_data["y"].to_numpy(dtype=np.float64) - ball_y)
@@ -0,0 +1,109 @@
+# Preprocesses a whole season of matches in parallel. Every folder in the season directory holding a metadata XML
+# and a .dat tracking file (in any of its subfolders, and optionally compressed, e.g. .dat.gz) is one match, and gets
+# its own player.csv and ball.csv.
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fileio import strip_compression
+from preprocess_data import MatchMetadata, stream_data
+
+# .dat files written by the preprocessing itself, which are not tracking data of a match
+DERIVED_DAT_FILES = {'in_play.dat', 'short_data.dat', 'home_team_turnover.dat', 'away_team_turnover.dat'}
+
+
+def find_matches(season_directory):
+    """
+    Finds the matches in a season directory.
+    :param season_directory: directory with one folder per match
+    :return: list of (match name, metadata file, .dat file)
+    """
+    matches = []
+
+    for match_name in sorted(os.listdir(season_directory)):
+        match_directory = os.path.join(season_directory, match_name)
+        if not os.path.isdir(match_directory):
+            continue
+
+        metadata_files = []
+        data_files = []
+        for dirpath, _, filenames in os.walk(match_directory):
+            for filename in sorted(filenames):
+                if filename.endswith('.xml'):
+                    metadata_files.append(os.path.join(dirpath, filename))
+                elif strip_compression(filename).endswith('.dat') and \
+                        strip_compression(filename) not in DERIVED_DAT_FILES:
+                    data_files.append(os.path.join(dirpath, filename))
+
+        if metadata_files and data_files:
+            matches.append((match_name, metadata_files[0], data_files[0]))
+        else:
+            print(f"Skipping {match_name}: no metadata XML and .dat file found")
+
+    return matches
+
+
+def preprocess_match(job):
+    """
+    Preprocesses one match. Run in a worker process.
+    :param job: (match name, metadata file, .dat file, output directory, seconds, store, compression)
+    :return: manifest entry for the match
+    """
+    match_name, metadata_file, datafile, output_directory, seconds, store, compression = job
+    entry = {'match': match_name, 'metadata': metadata_file, 'datafile': datafile,
+             'output_directory': output_directory}
+
+    start = time.perf_counter()
+    try:
+        # parsed straight from the XML: MatchMetadata.load would write its sidecar into the season directory
+        metadata = MatchMetadata.from_xml(metadata_file)
+        player_count, ball_count = stream_data(metadata.first_half, metadata.second_half, datafile, seconds,
+                                               output_directory, metadata, store, compression=compression)
+        entry.update({'status': 'ok', 'player_rows': player_count, 'ball_rows': ball_count})
+    except Exception as e:
+        entry.update({'status': 'failed', 'error': repr(e)})
+    entry['seconds_taken'] = round(time.perf_counter() - start, 3)
+
+    return entry
+
+
+def batch_preprocess(season_directory, output_root='data/matches', seconds=1, store=False, workers=None,
+                     compression=None):
+    """
+    Preprocesses every match of a season directory in a process pool, one match per worker at a time,
+    and writes a manifest of the timings and row counts of each match to output_root/manifest.json.
+    :param season_directory: directory with one folder per match
+    :param output_root: the outputs of each match are written to output_root/<match name>
+    :param seconds: Real seconds per data capture.
+    :param store: also write the tables of each match to its columnar match store
+    :param workers: number of worker processes, defaults to the number of cores
+    :param compression: compression extension for the CSV files of each match, e.g. '.gz'
+    :return: the manifest, a list of one entry per match
+    """
+    jobs = [(match_name, metadata_file, datafile, os.path.join(output_root, match_name), seconds, store, compression)
+            for match_name, metadata_file, datafile in find_matches(season_directory)]
+
+    start = time.perf_counter()
+    manifest = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(preprocess_match, job) for job in jobs]):
+            entry = future.result()
+            print(f"{entry['match']}: {entry['status']} in {entry['seconds_taken']}s")
+            manifest.append(entry)
+
+    manifest.sort(key=lambda entry: entry['match'])
+
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, 'manifest.json'), 'w') as file:
+        json.dump({'seconds_taken': round(time.perf_counter() - start, 3), 'matches': manifest}, file, indent=2)
+
+    return manifest
+
+
+def main():
+    batch_preprocess('data/season', store=True)
+
+
+if __name__ == "__main__":
+    main()
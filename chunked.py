@@ -0,0 +1,206 @@
+# Out of core versions of the preprocessing and metric stages, for running on full 25 Hz matches. Tables are read in
+# blocks of whole frames sized to a memory budget, and whatever a stage needs from earlier frames (the previous row for
+# possession changes, the frames leading up to a turnover) is carried from one block to the next, so the results are
+# the same as loading the whole table while memory use stays flat however long the match is.
+import numpy as np
+import pandas as pd
+
+import match_store
+import turnovers
+from fileio import find_file, open_file
+from player_and_ball import merge_player_and_ball
+
+MEMORY_BUDGET = 256 * 2 ** 20
+
+# parsing CSV text takes several times the memory of the parsed columns
+PARSE_OVERHEAD = 8
+
+
+def rows_per_block(columns, memory_budget=MEMORY_BUDGET):
+    """
+    :param columns: column names of the table
+    :param memory_budget: bytes a block may take while it is read
+    :return: number of rows to read at a time
+    """
+    dtypes = match_store.compact_dtypes(columns)
+    row_bytes = sum(1 if dtypes.get(column) == 'category' else np.dtype(dtypes.get(column, 'int64')).itemsize
+                    for column in columns)
+    return max(1, memory_budget // (row_bytes * PARSE_OVERHEAD))
+
+
+def iter_frame_blocks(filename, columns=None, memory_budget=MEMORY_BUDGET):
+    """
+    Reads a frame ordered match table a block at a time. A frame is never split between two blocks.
+    Like match_store.load_data, the columnar store is used when the table has been stored.
+    :param filename: path of the CSV file of the table, e.g. "data/player_and_ball.csv"
+    :param columns: columns to load, defaults to all of them
+    :param memory_budget: bytes a block may take while it is read
+    :return: generator of DataFrames with the compact types of match_store.compact
+    """
+    name = match_store.stored_name(filename)
+    if name is not None:
+        yield from iter_stored_blocks(name, columns, memory_budget)
+        return
+
+    filename = find_file(filename)
+    header = pd.read_csv(filename, nrows=0).columns
+    usecols = None if columns is None else list(dict.fromkeys(['frame_num'] + list(columns)))
+    size = rows_per_block(usecols or header, memory_budget)
+
+    # the rows of the last frame of a block may carry on into the next one, so they are held back
+    carry = None
+    for block in pd.read_csv(filename, usecols=usecols, chunksize=size):
+        if carry is not None:
+            block = pd.concat([carry, block], ignore_index=True)
+        cut = int(np.searchsorted(block['frame_num'].to_numpy(), block['frame_num'].iloc[-1], side='left'))
+        if cut == 0:
+            carry = block
+            continue
+        carry = block.iloc[cut:]
+        yield select(match_store.compact(block.iloc[:cut].reset_index(drop=True)), columns)
+
+    if carry is not None and len(carry):
+        yield select(match_store.compact(carry.reset_index(drop=True)), columns)
+
+
+def iter_stored_blocks(name, columns=None, memory_budget=MEMORY_BUDGET):
+    """
+    iter_frame_blocks for a table of the columnar store. The blocks are cut at frame boundaries found with a
+    binary search of the memory mapped frame numbers, so nothing but the block itself is read.
+    """
+    frame_nums = match_store.load_columns(name, ['frame_num'])['frame_num']
+    size = rows_per_block(columns or match_store.read_meta(name)['columns'], memory_budget)
+
+    start = 0
+    while start < len(frame_nums):
+        end = len(frame_nums)
+        if start + size < len(frame_nums):
+            end = int(np.searchsorted(frame_nums, frame_nums[start + size], side='left'))
+            if end == start:
+                end = int(np.searchsorted(frame_nums, frame_nums[start], side='right'))
+        last_frame = frame_nums[end] if end < len(frame_nums) else None
+        yield match_store.load_table(name, columns, frames=(frame_nums[start], last_frame)).copy()
+        start = end
+
+
+def select(df, columns):
+    return df if columns is None else df[list(columns)]
+
+
+def write_blocks(blocks, output_file):
+    """
+    Writes DataFrames one after another to a single CSV file, with one header.
+    The file is compressed when its name ends in e.g. .gz.
+    :return: number of rows written
+    """
+    rows = 0
+    header = True
+    with open_file(output_file, 'w', newline='') as file:
+        for block in blocks:
+            block.to_csv(file, index=False, header=header)
+            header = False
+            rows += len(block)
+    return rows
+
+
+def join_player_and_ball(output_file='data/player_and_ball.csv', player_file='data/player.csv',
+                         ball_file='data/ball.csv', memory_budget=MEMORY_BUDGET):
+    """
+    Out of core version of the merging stage, see player_and_ball.merge_player_and_ball.
+    The player and ball tables are read side by side, joining each block of players with the ball rows of the
+    same frames. No FrameTensor is built, as it would hold the whole match.
+    :return: number of rows of the joined table
+    """
+    balls = iter_frame_blocks(ball_file, memory_budget=memory_budget // 4)
+    ball_rows = next(balls, None)
+    # joined with the players left once the ball table has run out, so their blocks merge to no rows
+    no_ball = None if ball_rows is None else ball_rows.iloc[:0]
+
+    def merged_blocks():
+        nonlocal ball_rows
+        for players in iter_frame_blocks(player_file, memory_budget=memory_budget):
+            last_frame = players['frame_num'].iloc[-1]
+
+            # gather the ball rows up to the last frame of the block, keeping any after it for the next block
+            wanted = []
+            while ball_rows is not None:
+                cut = int(np.searchsorted(ball_rows['frame_num'].to_numpy(), last_frame, side='right'))
+                wanted.append(ball_rows.iloc[:cut])
+                if cut < len(ball_rows):
+                    ball_rows = ball_rows.iloc[cut:]
+                    break
+                ball_rows = next(balls, None)
+
+            if wanted:
+                yield merge_player_and_ball(players, pd.concat(wanted, ignore_index=True))
+            elif no_ball is not None:
+                yield merge_player_and_ball(players, no_ball)
+
+    return write_blocks(merged_blocks(), output_file)
+
+
+def change_over(input_file, output_file, kind=turnovers.LIVE, memory_budget=MEMORY_BUDGET):
+    """
+    Out of core version of new_heatblob.change_over: writes the first row of each turnover frame.
+    The turnovers come from the turnover index, so blocks need nothing carried over, as they hold whole frames.
+    :param kind: which turnovers, see turnovers.KINDS
+    :return: number of rows written
+    """
+    index = turnovers.load_turnover_index(kind)
+    blocks = iter_frame_blocks(input_file, memory_budget=memory_budget)
+    return write_blocks((turnovers.turnover_rows(block, index=index) for block in blocks), output_file)
+
+
+def detect_inplay_changes(csv_file, output_file, memory_budget=MEMORY_BUDGET):
+    """
+    Out of core version of line_player_v_player.detect_inplay_changes: writes the row before and the row at each
+    change of the in play status. The last row of each block is carried over in case the status changes between
+    two blocks.
+    :return: number of rows written
+    """
+    def changes():
+        previous = None
+        for block in iter_frame_blocks(csv_file, memory_budget=memory_budget):
+            if previous is not None:
+                block = pd.concat([previous, block], ignore_index=True)
+            in_play = block['inPlay'].astype(object)
+            changed = np.flatnonzero(in_play.ne(in_play.shift()).to_numpy()[1:]) + 1
+            previous = block.iloc[[-1]]
+
+            rows = np.empty(2 * len(changed), dtype=np.int64)
+            rows[0::2] = changed - 1
+            rows[1::2] = changed
+            yield block.iloc[rows]
+
+    return write_blocks(changes(), output_file)
+
+
+def collect_previous_frames(frame_nums_file, data_file, output_file, previous=3, memory_budget=MEMORY_BUDGET):
+    """
+    Out of core version of new_heatblob.collect_previous_frames: writes the rows of each frame of interest and of
+    the previous frames before it. The rows of the last frames of each block are carried over for the frames of
+    interest at the start of the next block. Frames of interest are written in match order.
+    :param previous: number of earlier frames wanted with each frame of interest
+    :return: number of rows written
+    """
+    wanted = pd.read_csv(frame_nums_file)['frame_num'].value_counts()
+
+    def collected():
+        carry = None
+        for block in iter_frame_blocks(data_file, memory_budget=memory_budget):
+            if carry is not None:
+                block = pd.concat([carry, block], ignore_index=True)
+            frame_nums = block['frame_num'].to_numpy()
+            frames, starts = np.unique(frame_nums, return_index=True)
+            starts = np.append(starts, len(block))
+
+            # only look for frames of interest in the new rows, the carried ones were looked at in the last block
+            first_new = 0 if carry is None else len(carry['frame_num'].unique())
+            for f in np.flatnonzero(np.isin(frames[first_new:], wanted.index)) + first_new:
+                window = block.iloc[starts[max(f - previous, 0)]:starts[f + 1]]
+                for _ in range(wanted[frames[f]]):
+                    yield window
+
+            carry = block.iloc[starts[max(len(frames) - previous, 0)]:]
+
+    return write_blocks(collected(), output_file)
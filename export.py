@@ -0,0 +1,71 @@
+# Writes the numbers behind the figures of the analyses instead of drawing them, for services that only need the
+# data: arrays as .npz, tables column by column as .npz, and everything else as JSON. Nothing here imports
+# Matplotlib, so an analysis run with output=ARRAYS never does.
+import json
+import os
+
+import numpy as np
+
+EXPORT_DIRECTORY = 'data/export'
+
+# what an analysis writes: its figures, or the arrays they are drawn from
+FIGURES = 'figures'
+ARRAYS = 'arrays'
+OUTPUTS = (FIGURES, ARRAYS)
+
+
+def check_output(output):
+    if output not in OUTPUTS:
+        raise ValueError(f"Unknown output {output!r}, expected one of {', '.join(OUTPUTS)}")
+    return output
+
+
+def export_path(name, extension, directory=EXPORT_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name + extension)
+
+
+def json_default(value):
+    """
+    Converts the NumPy values JSON does not know about.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Cannot write {type(value).__name__} as JSON")
+
+
+def write_json(name, value, directory=EXPORT_DIRECTORY):
+    """
+    :return: the filename written
+    """
+    filename = export_path(name, '.json', directory)
+    with open(filename, 'w') as file:
+        json.dump(value, file, indent=2, default=json_default)
+    return filename
+
+
+def write_arrays(name, directory=EXPORT_DIRECTORY, **arrays):
+    """
+    Writes named arrays to one compressed .npz file, read back with np.load.
+    :return: the filename written
+    """
+    filename = export_path(name, '.npz', directory)
+    np.savez_compressed(filename, **{key: np.asarray(array) for key, array in arrays.items()})
+    return filename
+
+
+def write_table(name, table, directory=EXPORT_DIRECTORY):
+    """
+    Writes a DataFrame column by column to a .npz file. Text and category columns are written as fixed width
+    strings, so the file loads without pickle.
+    :return: the filename written
+    """
+    columns = {}
+    for column in table.columns:
+        values = np.asarray(table[column])
+        columns[str(column)] = values.astype(str) if values.dtype == object else values
+    return write_arrays(name, directory, **columns)
@@ -0,0 +1,78 @@
+# Opens tracking and table files whether or not they are compressed, choosing the compression from the extension,
+# e.g. 987632.dat.gz or player.csv.xz. zstd (.zst) needs the zstandard package.
+import bz2
+import gzip
+import io
+import lzma
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+# gzip's own default of 9 makes writing several times slower for hardly any smaller files
+GZIP_LEVEL = 6
+
+
+def compression_of(filename):
+    """
+    :return: the compression extension of a file name (e.g. '.gz'), or None if it is not compressed
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in COMPRESSED_EXTENSIONS else None
+
+
+def strip_compression(filename):
+    """
+    :return: the file name without its compression extension, e.g. 987632.dat for 987632.dat.gz
+    """
+    return filename[:-len(compression_of(filename))] if compression_of(filename) else filename
+
+
+def open_zstd(filename, mode):
+    if zstandard is None:
+        raise ValueError(f"Opening {filename} needs the zstandard package")
+    return zstandard.open(filename, mode)
+
+
+OPENERS = {
+    '.gz': lambda filename, mode: gzip.open(filename, mode, compresslevel=GZIP_LEVEL),
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+    '.zst': open_zstd,
+}
+
+
+def open_file(filename, mode='r', newline=None):
+    """
+    Opens a file like open(), decompressing or compressing it on the fly when its name ends in a compression
+    extension. Text modes read and write str, binary modes bytes.
+    :param filename: file to open
+    :param mode: 'r', 'w', 'rb' or 'wb'
+    :param newline: as for open(), in text modes
+    :return: file object
+    """
+    compression = compression_of(filename)
+    binary = 'b' in mode
+
+    if compression is None:
+        return open(filename, mode) if binary else open(filename, mode, newline=newline)
+
+    file = OPENERS[compression](filename, mode.replace('t', '').replace('b', '') + 'b')
+    return file if binary else io.TextIOWrapper(file, newline=newline)
+
+
+def find_file(filename):
+    """
+    Finds a file or a compressed copy of it.
+    :param filename: name of the uncompressed file, e.g. data/player.csv
+    :return: the first of filename, filename.gz, filename.bz2, filename.xz and filename.zst that exists,
+    or filename if none do
+    """
+    for candidate in [filename] + [filename + extension for extension in COMPRESSED_EXTENSIONS]:
+        if os.path.exists(candidate):
+            return candidate
+    return filename
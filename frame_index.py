@@ -0,0 +1,143 @@
+# Index of where every frame starts in a raw .dat tracking file. It is built once per match and saved next to the
+# .dat file, after which any frame or range of frames can be read straight from a memory map of the file.
+import mmap
+import os
+import numpy as np
+
+from fileio import compression_of
+
+
+def index_path(datafile):
+    return datafile + '.idx.npz'
+
+
+def build_frame_index(datafile, index_file=None):
+    """
+    Builds the frame index of a .dat file and saves it.
+    :param datafile: .dat file to index
+    :param index_file: where to save the index, defaults to the .dat file name with .idx.npz added
+    :return: first frame number, and an array giving the byte offset of each frame from the first frame on
+    (-1 where a frame is missing from the file)
+    """
+    frames = []
+    offsets = []
+
+    with open(datafile, 'rb') as file:
+        position = 0
+        for line in file:
+            frames.append(int(line.split(b':', 1)[0]))
+            offsets.append(position)
+            position += len(line)
+
+    frames = np.array(frames, dtype=np.int64)
+    first_frame = int(frames.min()) if len(frames) else 0
+
+    # one slot per frame number, so a frame is found without searching
+    lookup = np.full(int(frames.max()) - first_frame + 1 if len(frames) else 0, -1, dtype=np.int64)
+    lookup[frames - first_frame] = offsets
+
+    # saved through an open file, as np.savez adds .npz to a file name without it and the index would not be found
+    stat = os.stat(datafile)
+    with open(index_file or index_path(datafile), 'wb') as file:
+        np.savez(file, first_frame=first_frame, offsets=lookup, size=stat.st_size, mtime=stat.st_mtime)
+
+    return first_frame, lookup
+
+
+def load_frame_index(datafile, index_file=None):
+    """
+    Loads the frame index of a .dat file, building it first if it is missing or the .dat file has changed.
+    :param datafile: .dat file
+    :param index_file: where the index is saved, defaults to the .dat file name with .idx.npz added
+    :return: first frame number and the array of frame offsets, see build_frame_index
+    """
+    index_file = index_file or index_path(datafile)
+
+    if os.path.exists(index_file):
+        stat = os.stat(datafile)
+        with np.load(index_file) as index:
+            if int(index['size']) == stat.st_size and float(index['mtime']) == stat.st_mtime:
+                return int(index['first_frame']), index['offsets']
+
+    return build_frame_index(datafile, index_file)
+
+
+class FrameReader:
+    """
+    Random access to the frames of a .dat file. Looking up a frame is a single array access followed by a read
+    from the memory mapped file.
+
+    with FrameReader('data/gamedata/987632.dat') as reader:
+        line = reader.frame(1420876)
+    """
+
+    def __init__(self, datafile, index_file=None):
+        if compression_of(datafile):
+            raise ValueError(f"{datafile} is compressed, frames can only be looked up in an uncompressed .dat file")
+        self.datafile = datafile
+        self.first_frame, self.offsets = load_frame_index(datafile, index_file)
+        self.file = open(datafile, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def offset(self, frame_num):
+        """
+        :return: byte offset of a frame, or -1 if the file does not have it
+        """
+        slot = frame_num - self.first_frame
+        if slot < 0 or slot >= len(self.offsets):
+            return -1
+        return int(self.offsets[slot])
+
+    def line_end(self, offset):
+        end = self.data.find(b'\n', offset)
+        return len(self.data) if end == -1 else end + 1
+
+    def frame(self, frame_num):
+        """
+        Reads one frame.
+        :param frame_num: frame number
+        :return: the line of the .dat file for the frame, or None if the file does not have it
+        """
+        offset = self.offset(frame_num)
+        if offset == -1:
+            return None
+        return self.data[offset:self.line_end(offset)].decode()
+
+    def frames(self, start, end):
+        """
+        Reads a range of frames.
+        :param start: first frame number
+        :param end: frame number after the last one (exclusive)
+        :return: list of the lines of the .dat file for the frames in the range
+        """
+        first = max(start - self.first_frame, 0)
+        last = max(min(end - self.first_frame, len(self.offsets)), first)
+        present = self.offsets[first:last]
+        present = present[present >= 0]
+        if len(present) == 0:
+            return []
+
+        # frames are stored in order, so the range is one contiguous block of the file
+        block = self.data[int(present[0]):self.line_end(int(present[-1]))]
+        return block.decode().splitlines(keepends=True)
+
+    def previous(self, frame_num, count, step=1):
+        """
+        Reads a frame and the frames leading up to it.
+        :param frame_num: frame number
+        :param count: number of earlier frames wanted
+        :param step: frames between each of them, e.g. 25 for one a second
+        :return: list of lines, oldest first, skipping any frame the file does not have
+        """
+        lines = (self.frame(frame_num - step * k) for k in range(count, -1, -1))
+        return [line for line in lines if line is not None]
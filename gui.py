@@ -1,6 +1,6 @@
 import tkinter as tk
-import pandas as pd
 import analyse
+import match_store
 from tkinter import messagebox
 from PIL import Image, ImageTk
 
@@ -56,7 +56,7 @@ def is_valid_number_list(input_str):
 
 def get_unique_squad_numbers_by_team():
     try:
-        player_data = pd.read_csv("data/player.csv")
+        player_data = match_store.load_table("player", columns=["team_id", "squadNum"])
         team_ids = player_data["team_id"].unique()
         unique_squad_nums_by_team = {}
         for team_id in team_ids:
@@ -229,28 +229,31 @@ def set_team_id2(id):
     label_team_id2.config(text=f"Team ID 2: {"Away" if id == 0 else "Home"}")
 
 
-# Create the main window
-root = tk.Tk()
-root.geometry("400x300")
-root.title("Heatmap Generator")
+# Only when run, not when imported: under spawn the render pool's workers import this file again, and would
+# each open a window and block in its loop
+if __name__ == "__main__":
+    # Create the main window
+    root = tk.Tk()
+    root.geometry("400x300")
+    root.title("Heatmap Generator")
 
-# label  displaying the current interface context
-current_interface_label = tk.Label(root, text="Select an analysis mode", font=("Helvetica", 12, "bold"))
-current_interface_label.pack(pady=10)
+    # label  displaying the current interface context
+    current_interface_label = tk.Label(root, text="Select an analysis mode", font=("Helvetica", 12, "bold"))
+    current_interface_label.pack(pady=10)
 
-# Player Influence
-btn_player_vs_ball = tk.Button(root, text="Player Influence", command=show_player_vs_ball_interface)
-btn_player_vs_ball.pack(pady=5, padx=20, expand=True)
+    # Player Influence
+    btn_player_vs_ball = tk.Button(root, text="Player Influence", command=show_player_vs_ball_interface)
+    btn_player_vs_ball.pack(pady=5, padx=20, expand=True)
 
-# Team Closeness
-btn_player_vs_player = tk.Button(root, text="Team Closeness", command=show_team_closeness_interface)
-btn_player_vs_player.pack(pady=5, padx=20, expand=True)
+    # Team Closeness
+    btn_player_vs_player = tk.Button(root, text="Team Closeness", command=show_team_closeness_interface)
+    btn_player_vs_player.pack(pady=5, padx=20, expand=True)
 
-# Blocking Passing Lane interface
-btn_team_closeness = tk.Button(root, text="Blocking Passing Lanes", command=show_blocking_pass_interface)
-btn_team_closeness.pack(pady=5, padx=20, expand=True)
+    # Blocking Passing Lane interface
+    btn_team_closeness = tk.Button(root, text="Blocking Passing Lanes", command=show_blocking_pass_interface)
+    btn_team_closeness.pack(pady=5, padx=20, expand=True)
 
-show_main_window()
+    show_main_window()
 
-# Start the GUI loop
-root.mainloop()
+    # Start the GUI loop
+    root.mainloop()
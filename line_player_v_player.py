@@ -1,11 +1,13 @@
-import matplotlib.pyplot as plt
 import pandas as pd
-from mplsoccer.pitch import Pitch
-from matplotlib import gridspec
 import numpy as np
 
-from preprocess_data import pitch
+from preprocess_data import get_metadata, pitch
 import analyse
+import export
+import match_store
+import render
+import turnovers
+from player_and_ball import FrameTensor
 
 # pitch details
 pitch_length = pitch["x"]
@@ -19,26 +21,86 @@ def calculate_closeness(input_data):
         (input_data["y_player"] - input_data["y_ball"]) ** 2
     )
 
-    closeness_records = []
-    for frame in input_data["frame_num"].unique():
-        frame_data = input_data[input_data["frame_num"] == frame]
+    # frames x players view of the data, so every frame is sorted at once
+    tensor = FrameTensor.from_frame(input_data)
+    distances = tensor.distances_to_ball()
+
+    closest = []
+    for team_id in (0, 1):
+        # Sort each frame by distance, players of the other team or missing go last
+        team_distances = np.where(tensor.team_slots(team_id), distances, np.nan)
+        order = np.argsort(np.where(np.isnan(team_distances), np.inf, team_distances), axis=1, kind="stable")[:, :5]
+        in_team = ~np.isnan(np.take_along_axis(team_distances, order, axis=1))
+        closest.append(np.where(in_team, np.take_along_axis(tensor.rows, order, axis=1), -1))
+
+    # the home team's five closest, then the away team's, frame by frame
+    rows = np.concatenate(closest, axis=1).ravel()
+    closeness_df = input_data.iloc[rows[rows >= 0]].reset_index(drop=True)
+    return closeness_df
 
-        # Split by team and sort by distance
-        home_team = frame_data[frame_data["team_id"] == 0].sort_values(by="distance_to_ball").head(5)
-        away_team = frame_data[frame_data["team_id"] == 1].sort_values(by="distance_to_ball").head(5)
 
-        # Append or process data as needed
-        closeness_records.append(home_team)
-        closeness_records.append(away_team)
+def closest_pairs(frame_data):
+    """
+    Pairs each home player of a frame with the closest away player not yet paired, leaving out the pair furthest
+    apart (the goalkeepers).
+    :param frame_data: rows of player_and_ball for one frame
+    :return: list of the pairs, closest first, as rows of the closeness table
+    """
+    frame = frame_data["frame_num"].iloc[0]
+    home_team = frame_data[frame_data["team_id"] == 1]
+    away_team = frame_data[frame_data["team_id"] == 0]
+    distances = []
+
+    for _, home_player in home_team.iterrows():
+        for _, away_player in away_team.iterrows():
+            distance = np.sqrt(
+                (home_player["x_player"] - away_player["x_player"]) ** 2 +
+                (home_player["y_player"] - away_player["y_player"]) ** 2
+            )
+            distances.append({
+                "frame_num": frame,
+                "poss": frame_data["poss"].iloc[0],
+                "home_player_id": home_player["player_id"],
+                "away_player_id": away_player["player_id"],
+                "distance": distance,
+                "x_home_player": home_player["x_player"],
+                "y_home_player": home_player["y_player"],
+                "x_away_player": away_player["x_player"],
+                "y_away_player": away_player["y_player"],
+                "x_ball": home_player["x_ball"],
+                "y_ball": home_player["y_ball"],
+                "home_squadNum": str(int(home_player["squadNum"])),
+                "away_squadNum": str(int(away_player["squadNum"])),
+                "team_id": home_player["team_id"]
+            })
+
+    if not distances:
+        return []
+
+    distances_df = pd.DataFrame(distances)
+    distances_df.sort_values(by="distance", inplace=True)
+
+    # Dropping the row with the largest distance (goalkeepers)
+    distances_df = distances_df[:-1]  # Exclude the largest distance
 
-    # Combine all records into a DataFrame
-    closeness_df = pd.concat(closeness_records, ignore_index=True)
-    return closeness_df
+    closeness_records = []
+    paired_home_players = set()
+    paired_away_players = set()
+    for _, row in distances_df.iterrows():
+        home_id = row["home_player_id"]
+        away_id = row["away_player_id"]
+        if home_id in paired_home_players or away_id in paired_away_players:
+            continue
+        closeness_records.append(row)
+        paired_home_players.add(home_id)
+        paired_away_players.add(away_id)
+
+    return closeness_records
 
 
 def calculate_closeness_for_frames(frame_nums_file, input_data_file):
     frame_nums_data = pd.read_csv(frame_nums_file)
-    p_b_data = pd.read_csv(input_data_file)
+    p_b_data = match_store.load_data(input_data_file)
 
     def mplsoccer(player_ball_data, start_frame):
         closeness_records = []
@@ -46,51 +108,7 @@ def calculate_closeness_for_frames(frame_nums_file, input_data_file):
 
         for frame in unique_frames:
             frame_data = player_ball_data[player_ball_data["frame_num"] == frame]
-
-            home_team = frame_data[frame_data["team_id"] == 1]
-            away_team = frame_data[frame_data["team_id"] == 0]
-            distances = []
-
-            for _, home_player in home_team.iterrows():
-                for _, away_player in away_team.iterrows():
-                    distance = np.sqrt(
-                        (home_player["x_player"] - away_player["x_player"]) ** 2 +
-                        (home_player["y_player"] - away_player["y_player"]) ** 2
-                    )
-                    distances.append({
-                        "frame_num": frame,
-                        "poss": frame_data["poss"].iloc[0],
-                        "home_player_id": home_player["player_id"],
-                        "away_player_id": away_player["player_id"],
-                        "distance": distance,
-                        "x_home_player": home_player["x_player"],
-                        "y_home_player": home_player["y_player"],
-                        "x_away_player": away_player["x_player"],
-                        "y_away_player": away_player["y_player"],
-                        "x_ball": home_player["x_ball"],
-                        "y_ball": home_player["y_ball"],
-                        "home_squadNum": str(int(home_player["squadNum"])),
-                        "away_squadNum": str(int(away_player["squadNum"])),
-                        "team_id": home_player["team_id"]
-                    })
-
-            distances_df = pd.DataFrame(distances)
-            distances_df.sort_values(by="distance", inplace=True)
-
-            # Dropping the row with the largest distance (goalkeepers)
-            if not distances_df.empty:
-                distances_df = distances_df[:-1]  # Exclude the largest distance
-
-            paired_home_players = set()
-            paired_away_players = set()
-            for _, row in distances_df.iterrows():
-                home_id = row["home_player_id"]
-                away_id = row["away_player_id"]
-                if home_id in paired_home_players or away_id in paired_away_players:
-                    continue
-                closeness_records.append(row)
-                paired_home_players.add(home_id)
-                paired_away_players.add(away_id)
+            closeness_records.extend(closest_pairs(frame_data))
 
         return pd.DataFrame(closeness_records)
 
@@ -121,69 +139,85 @@ def preprocess_for_closeness(data):
     return relevant_frames
 
 
-def five_v_five_heatmap(closeness_df, pitch_length, pitch_width, mean_per_frame):
-    analyse.remove_old_files()  # Clears old heatmap images
-
-    # Generate heatmap for the first 10 unique frames
-    unique_frames = closeness_df["frame_num"].unique()
-
-    for frame in unique_frames:
-        # Initialise the pitch
-        fig, ax = plt.subplots(figsize=(10, 7))
-        pitch = Pitch(pitch_type="custom", pitch_color="#22312b", line_color="white",
-                      pitch_length=pitch_length, pitch_width=pitch_width)
-        pitch.draw(ax=ax)
-
-        frame_data = closeness_df[closeness_df["frame_num"] == frame]
-
-        if frame_data["poss"].iloc[0] == "H":
-            possession_status = "Home Possession"
-        else:
-            possession_status = "Away Possession"
-
-        # Plot players and draw lines between home players and their closest opponents
-        for _, row in frame_data.iterrows():
-            # Home player
-            pitch.scatter(row["x_home_player"], row["y_home_player"], ax=ax, s=120, color="red", edgecolors="black",
-                          zorder=2)
-            home_p = row["home_squadNum"]
-            plt.text(row["x_home_player"] + 1, row["y_home_player"] + 1, home_p, color="white", fontsize=6, ha="center",
-                     va="center", zorder=3, bbox=dict(facecolor="red", alpha=0.25, edgecolor="black"))
-
-            # Away player
-            pitch.scatter(row["x_away_player"], row["y_away_player"], ax=ax, s=120, color="blue", edgecolors="black",
-                          zorder=2)
-            away_p = row["away_squadNum"]
-            plt.text(row["x_away_player"] + 1, row["y_away_player"] + 1, away_p, color="white", fontsize=6, ha="center",
-                     va="center", zorder=3, bbox=dict(facecolor="blue", alpha=0.25, edgecolor="black"))
-
-            # Line between home player and opponent indicating closeness
-            pitch.lines(row["x_home_player"], row["y_home_player"], row["x_away_player"], row["y_away_player"], lw=1,
-                        color="yellow", ax=ax, zorder=1)
-
-        # Plot the ball's position
-        ball_x = row["x_ball"]
-        ball_y = row["y_ball"]
-        pitch.scatter(ball_x, ball_y, ax=ax, s=120, color="white", edgecolors="black", zorder=2, label="Ball")
-
-        plt.title(f"Frame: {frame} - {possession_status}", color="black")
-
-        # Find the mean distance for the current frame from mean_per_frame DataFrame
-        frame_mean_distance = mean_per_frame.loc[mean_per_frame['frame_num'] == frame, 'mean_distance'].iloc[0]
-        info_text = f"Mean Distance: {frame_mean_distance:.2f}"
-
-        plt.figtext(0.5, 0.01, info_text, ha="center", fontsize=10, color="black")
-
-        plt.legend(loc="upper right")
-
-        # Save the heatmap for the current frame
-        plt.savefig(f"figures/player_v_player_heatmap_frame_{frame}.png", dpi=300)
-        plt.close()
+def five_v_five_heatmap(closeness_df, pitch_length, pitch_width, mean_per_frame, workers=render.RENDER_WORKERS,
+                        output=export.FIGURES):
+    export.check_output(output)
+
+    # Find the mean distance for each frame from mean_per_frame DataFrame
+    mean_distances = mean_per_frame.drop_duplicates(subset="frame_num").set_index("frame_num")["mean_distance"]
+
+    if output == export.ARRAYS:
+        # the paired coordinates of every frame, with the frame's mean distance, to
+        # data/export/player_v_player_closeness.npz
+        pairs = closeness_df[["frame_num", "poss", "home_squadNum", "x_home_player", "y_home_player",
+                              "away_squadNum", "x_away_player", "y_away_player", "distance", "x_ball", "y_ball"]]
+        export.write_table("player_v_player_closeness",
+                           pairs.assign(mean_distance=pairs["frame_num"].map(mean_distances).to_numpy()))
+        return
+
+    # One figure for each unique frame, drawn by plots.five_v_five_frame
+    jobs = [{"filename": f"figures/player_v_player_heatmap_frame_{frame}.png", "frame": frame,
+             "frame_data": frame_data, "pitch_length": pitch_length, "pitch_width": pitch_width,
+             "mean_distance": mean_distances[frame]}
+            for frame, frame_data in closeness_df.groupby("frame_num", sort=False)]
+
+    analyse.remove_old_files(keep=[job["filename"] for job in jobs])  # Clears old heatmap images
+    render.render_figures("plots.five_v_five_frame", jobs, workers)
+
+
+def lead_up_closeness(p_b_data, turnover_frames, lead, step):
+    """
+    Pairs the players, as calculate_closeness_for_frames does, in the frames leading up to each turnover.
+    :param p_b_data: player_and_ball table
+    :param turnover_frames: frame numbers of the turnovers
+    :param lead: frames before a turnover that lead up to it
+    :param step: frames between the frames picked from the lead-up, see turnovers.lead_up_frames
+    :return: list of (turnover frame, list of (frame, closeness rows of the frame, mean distance of the frame)), the
+    frames in match order, ending with the turnover
+    """
+    p_b_data = p_b_data.sort_values(by="frame_num", kind="stable")
+    frames, starts = np.unique(p_b_data["frame_num"].to_numpy(), return_index=True)
+    starts = np.append(starts, len(p_b_data))
+
+    lead_ups = []
+    for turnover in turnover_frames:
+        clip = []
+        for row in np.searchsorted(frames, turnovers.lead_up_frames(frames, turnover, lead, step)):
+            pairs = pd.DataFrame(closest_pairs(p_b_data.iloc[starts[row]:starts[row + 1]]))
+            if not pairs.empty:
+                clip.append((frames[row], pairs, pairs["distance"].mean()))
+        if clip:
+            lead_ups.append((turnover, clip))
+    return lead_ups
+
+
+def five_v_five_clips(p_b_data, pitch_length, pitch_width, kind=turnovers.LIVE, lead_seconds=turnovers.LEAD_SECONDS,
+                      step_seconds=1, extension=render.CLIP_EXTENSION, fps=render.CLIP_FPS,
+                      workers=render.RENDER_WORKERS):
+    """
+    Renders the frames leading up to each turnover as one clip per turnover, drawn by plots.five_v_five_clip.
+    :param p_b_data: player_and_ball table the players are paired from
+    :param kind: turnovers.RESTART or turnovers.LIVE, None for both. main draws the frames of the live turnovers
+    :param lead_seconds: seconds of play before a turnover that make up its clip
+    :param step_seconds: seconds of play between the frames of a clip
+    :param extension: format of the clips, ".gif", ".mp4" (needs ffmpeg) or ".png" for a strip of the frames
+    :param fps: frames shown per second
+    """
+    frame_rate = get_metadata().frame_rate
+    turnover_frames = turnovers.load_turnover_index(kind)["frame_num"]
+
+    jobs = [{"filename": f"figures/player_v_player_turnover_{turnover}{extension}", "frames": frames,
+             "pitch_length": pitch_length, "pitch_width": pitch_width, "fps": fps}
+            for turnover, frames in lead_up_closeness(p_b_data, turnover_frames, lead_seconds * frame_rate,
+                                                      max(1, int(step_seconds * frame_rate)))]
+
+    analyse.remove_old_files(keep=[job["filename"] for job in jobs])  # Clears old heatmap images
+    render.render_figures("plots.five_v_five_clip", jobs, workers)
 
 
 def detect_inplay_changes(csv_file, output_file):
     # Read the CSV file
-    data = pd.read_csv(csv_file)
+    data = match_store.load_data(csv_file)
 
     # Find rows where the "inPlay" status changes
     status_changed = data["inPlay"].ne(data["inPlay"].shift())
@@ -193,10 +227,10 @@ def detect_inplay_changes(csv_file, output_file):
     change_rows = []
     for idx in change_indices:
         # Append the row before the change and the row at the point of change
-        change_rows.extend(data.iloc[[idx - 1, idx]].values.tolist())
+        change_rows.extend([idx - 1, idx])
 
-    # Convert the list to a DataFrame
-    change_df = pd.DataFrame(change_rows, columns=data.columns)
+    # Select the rows, keeping the column types of the table
+    change_df = data.iloc[change_rows]
 
     # Output to a new CSV file, this will create the file if it does not exist
     change_df.to_csv(output_file, index=False)
@@ -204,12 +238,10 @@ def detect_inplay_changes(csv_file, output_file):
 
 def change_over(input_file, output_file):
     # Read the input CSV file
-    data = pd.read_csv(input_file)
-
-    poss_changed = (data["poss"] != data["poss"].shift()) & (
-                data["inPlay"] == "Alive" != data["inPlay"].shift() == "Dead")
+    data = match_store.load_data(input_file)
 
-    change_over_rows = data[poss_changed]
+    # the ball coming back into play with the other team in possession
+    change_over_rows = turnovers.turnover_rows(data, turnovers.RESTART)
     change_over_rows.to_csv(output_file, index=False)
 
 
@@ -239,7 +271,7 @@ def extract_changes_in_possession(csv_file):
 
 
 def main():
-    # data = pd.read_csv("data/player_and_ball.csv")
+    # data = match_store.load_table("player_and_ball")
     # data.sort_values(by="frame_num", inplace=True)
 
     # Pre-process data to find relevant frames for closeness calculation
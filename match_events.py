@@ -0,0 +1,261 @@
+# Intervals of the match read from the tail of each raw line (":<ball>,<possession>,<status>[,<restart>];:"):
+#   possession: spells of one team in possession
+#   dead_ball: periods the ball is out of play
+#   set_piece: frames flagged with a restart (SetAway, SetHome, Whistle or B4)
+# Each interval runs from its start frame up to its end frame (exclusive), and no interval spans a gap in the frames,
+# such as half time. EventIndex answers which interval holds a frame, or which fall in a range of frames or minutes,
+# with binary searches, so analyses can pick out parts of the match without going over the frames again.
+import numpy as np
+import pandas as pd
+
+from preprocess_data import BLOCK_LINES, blocks, get_metadata, read_in_play
+
+POSSESSION = 'possession'
+DEAD_BALL = 'dead_ball'
+SET_PIECE = 'set_piece'
+KINDS = (POSSESSION, DEAD_BALL, SET_PIECE)
+
+EVENTS_FILE = 'data/events.csv'
+
+RESTARTS = ('SetAway', 'SetHome', 'Whistle', 'B4')
+
+
+def read_state(line):
+    """
+    Reads the frame number, possession, status and restart from the tail of a raw line.
+    :return: (frame_num, poss, status, restart), restart '' where there is none, or None if the line has no state
+    """
+    frame, _, rest = line.partition(':')
+    rest = rest.rstrip()
+    if not rest.endswith(';:') or not frame.isdigit():
+        return None
+    ball = rest[rest.rfind(':', 0, -1) + 1:-2].split(',')
+    restart = ball.pop() if ball[-1] in RESTARTS else ''
+    if len(ball) < 2 or ball[-2] not in ('A', 'H') or ball[-1] not in ('Alive', 'Dead'):
+        return None
+    return int(frame), ball[-2], ball[-1], restart
+
+
+def read_states(lines):
+    """
+    Reads the frame number, possession, status and restart of every line, see read_state.
+    :param lines: raw .dat lines, in frame order
+    :return: DataFrame with columns frame_num, poss, status and restart ('' where there is none).
+    Lines without these fields are left out.
+    """
+    parts = []
+    for block in blocks(lines, BLOCK_LINES):
+        states = [state for state in map(read_state, block) if state is not None]
+        frame_nums, poss, status, restart = zip(*states) if states else ((), (), (), ())
+        parts.append(pd.DataFrame({'frame_num': np.array(frame_nums, dtype=np.int64),
+                                   'poss': pd.Categorical(poss),
+                                   'status': pd.Categorical(status),
+                                   'restart': pd.Categorical(restart)}))
+
+    if not parts:
+        return pd.DataFrame({'frame_num': pd.Series(dtype=np.int64), 'poss': [], 'status': [], 'restart': []})
+    return pd.concat(parts, ignore_index=True)
+
+
+def runs(start_frames, end_frames, *values):
+    """
+    Splits a frame ordered sequence of spans of frames into runs of equal values over consecutive frames.
+    :param start_frames: first frame of each span
+    :param end_frames: frame after the last one of each span (exclusive)
+    :param values: one or more sequences of a value for each span, a run ends where any of them changes
+    :return: start row and end row (exclusive) of each run
+    """
+    start_frames, end_frames = np.asarray(start_frames), np.asarray(end_frames)
+    changed = start_frames[1:] != end_frames[:-1]
+    for value in values:
+        value = np.asarray(value)
+        changed |= value[1:] != value[:-1]
+    breaks = np.flatnonzero(changed) + 1
+    starts = np.concatenate(([0], breaks)) if len(start_frames) else np.array([], dtype=np.int64)
+    ends = np.concatenate((breaks, [len(start_frames)])) if len(start_frames) else np.array([], dtype=np.int64)
+    return starts, ends
+
+
+def intervals(kind, start_frames, end_frames, values, keep=None):
+    """
+    :param kind: kind of the intervals
+    :param start_frames: first frame of each span, in order
+    :param end_frames: frame after the last one of each span (exclusive)
+    :param values: value of each span, the detail of the interval it is part of
+    :param keep: optional boolean mask of the spans that can be part of an interval
+    :return: DataFrame of the intervals with columns kind, detail, start_frame and end_frame
+    """
+    starts, ends = runs(start_frames, end_frames, values if keep is None else np.where(keep, values, None))
+    if keep is not None:
+        kept = np.asarray(keep)[starts]
+        starts, ends = starts[kept], ends[kept]
+    return pd.DataFrame({'kind': kind, 'detail': np.asarray(values)[starts],
+                         'start_frame': start_frames[starts], 'end_frame': end_frames[ends - 1]})
+
+
+class StateRuns:
+    """
+    The possession, status and restart of a stream of raw lines as runs of consecutive frames in the same state,
+    gathered a block at a time while the lines are read for something else, e.g. by preprocess_data.stream_data,
+    so the events are found without reading the .dat file again.
+
+    state_runs = StateRuns()
+    lines = state_runs.watch(read_in_play(half1, half2, datafile))
+    ...  # read the lines
+    state_runs.write(EVENTS_FILE)
+    """
+
+    def __init__(self, parts=()):
+        self.parts = [part for part in parts if part is not None]
+
+    def add(self, lines):
+        """
+        Reads the states of a block of lines, see read_states.
+        """
+        states = read_states(lines)
+        frame_nums = states['frame_num'].to_numpy()
+        poss, status, restart = (states[column].to_numpy().astype(str) for column in ('poss', 'status', 'restart'))
+        starts, ends = runs(frame_nums, frame_nums + 1, poss, status, restart)
+        self.parts.append(pd.DataFrame({'start_frame': frame_nums[starts], 'end_frame': frame_nums[ends - 1] + 1,
+                                        'poss': poss[starts], 'status': status[starts], 'restart': restart[starts]}))
+
+    def watch(self, lines):
+        """
+        :return: generator of the lines, reading the states of each block of them as it goes
+        """
+        for block in blocks(lines, BLOCK_LINES):
+            self.add(block)
+            yield from block
+
+    def table(self):
+        """
+        :return: DataFrame of the runs with columns start_frame, end_frame (exclusive), poss, status and restart.
+        Runs of neighbouring blocks are not joined, intervals does that.
+        """
+        if not self.parts:
+            return pd.DataFrame({'start_frame': pd.Series(dtype=np.int64), 'end_frame': pd.Series(dtype=np.int64),
+                                 'poss': pd.Series(dtype=str), 'status': pd.Series(dtype=str),
+                                 'restart': pd.Series(dtype=str)})
+        return pd.concat(self.parts, ignore_index=True)
+
+    def events(self):
+        """
+        :return: the interval table of the lines, see extract_events
+        """
+        table = self.table()
+        start_frames, end_frames = table['start_frame'].to_numpy(), table['end_frame'].to_numpy()
+        status = table['status'].to_numpy().astype(str)
+        restart = table['restart'].to_numpy().astype(str)
+
+        return pd.concat([
+            intervals(POSSESSION, start_frames, end_frames, table['poss'].to_numpy().astype(str)),
+            intervals(DEAD_BALL, start_frames, end_frames, np.full(len(table), ''), keep=status == 'Dead'),
+            intervals(SET_PIECE, start_frames, end_frames, restart, keep=restart != ''),
+        ], ignore_index=True)
+
+    def write(self, output_file=EVENTS_FILE):
+        """
+        Writes the interval table of the lines.
+        :return: number of intervals
+        """
+        events = self.events()
+        events.to_csv(output_file, index=False)
+        return len(events)
+
+
+def extract_events(lines):
+    """
+    Builds the interval table of a stream of raw .dat lines.
+    :param lines: raw .dat lines, in frame order
+    :return: DataFrame with columns kind, detail, start_frame and end_frame, ordered by kind then start frame.
+    detail is the team in possession for a possession spell, the restart for a set piece and empty for a dead ball.
+    """
+    state_runs = StateRuns()
+    for _ in state_runs.watch(lines):
+        pass
+    return state_runs.events()
+
+
+def write_events(datafile, output_file=EVENTS_FILE, metadata=None):
+    """
+    Writes the interval table of the frames in play of a .dat file, reading the file for it alone. The preprocessing
+    gathers the events while it reads the file instead, see preprocess_data.stream_data.
+    :param datafile: .dat file, optionally compressed
+    :param output_file: where the table is written
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :return: number of intervals
+    """
+    metadata = metadata or get_metadata()
+    state_runs = StateRuns()
+    for _ in state_runs.watch(read_in_play(metadata.first_half, metadata.second_half, datafile)):
+        pass
+    return state_runs.write(output_file)
+
+
+def frame_at_minute(minute, metadata=None):
+    """
+    :param minute: minute of the match, 0 to 45 for the first half and 45 to 90 for the second
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :return: frame number at that minute
+    """
+    metadata = metadata or get_metadata()
+    if minute < 45:
+        return metadata.first_half['start'] + round(minute * 60 * metadata.frame_rate)
+    return metadata.second_half['start'] + round((minute - 45) * 60 * metadata.frame_rate)
+
+
+class EventIndex:
+    """
+    Interval index over the table of extract_events. The intervals of one kind never overlap, so their start and
+    end frames are both sorted and every query is a binary search.
+
+    index = EventIndex.load()
+    spell = index.containing(POSSESSION, 1420876)
+    set_pieces = index.in_minutes(SET_PIECE, 20, 30)
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.kinds = {}
+        for kind, group in events.groupby('kind', sort=False):
+            group = group.sort_values(by='start_frame').reset_index(drop=True)
+            self.kinds[kind] = (group, group['start_frame'].to_numpy(), group['end_frame'].to_numpy())
+
+    @classmethod
+    def load(cls, filename=EVENTS_FILE):
+        return cls(pd.read_csv(filename, keep_default_na=False))
+
+    def table(self, kind):
+        return self.kinds[kind][0] if kind in self.kinds else self.events.iloc[0:0]
+
+    def containing(self, kind, frame_num):
+        """
+        :return: the interval of a kind holding a frame, as a Series, or None if there is none
+        """
+        if kind not in self.kinds:
+            return None
+        group, starts, ends = self.kinds[kind]
+        i = int(np.searchsorted(starts, frame_num, side='right')) - 1
+        if i < 0 or ends[i] <= frame_num:
+            return None
+        return group.iloc[i]
+
+    def overlapping(self, kind, start, end):
+        """
+        :param start: first frame of the range
+        :param end: frame after the last one of the range (exclusive)
+        :return: DataFrame of the intervals of a kind that overlap the range of frames
+        """
+        if kind not in self.kinds:
+            return self.table(kind)
+        group, starts, ends = self.kinds[kind]
+        first = int(np.searchsorted(ends, start, side='right'))
+        last = int(np.searchsorted(starts, end, side='left'))
+        return group.iloc[first:max(first, last)]
+
+    def in_minutes(self, kind, minute_from, minute_to, metadata=None):
+        """
+        :return: DataFrame of the intervals of a kind that overlap the minutes of the match from minute_from to
+        minute_to, see frame_at_minute
+        """
+        return self.overlapping(kind, frame_at_minute(minute_from, metadata), frame_at_minute(minute_to, metadata))
@@ -0,0 +1,407 @@
+# Columnar storage of the match tables (player, ball, player_and_ball). Each table is a directory holding one .npy
+# file per column, which can be memory mapped, so loading a table does not need any CSV parsing.
+# A stored table remembers the CSV file it was written with, and is passed over once that file is written again
+# without it, e.g. by preprocessing again without store=True.
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from fileio import find_file, strip_compression
+
+CSV_DIRECTORY = 'data'
+STORE_DIRECTORY = 'data/store'
+
+# smallest types that hold the values of each column of the match tables
+COMPACT_DTYPES = {
+    'frame_num': 'int32',
+    'team_id': 'int8',
+    'player_id': 'int16',
+    'squadNum': 'int16',
+    'poss': 'category',
+    'inPlay': 'category',
+}
+COMPACT_FLOAT_COLUMNS = ('x', 'y', 'z', 'speed', 'x_player', 'y_player', 'speed_player', 'x_ball', 'y_ball',
+                         'speed_ball', 'distance_to_ball')
+
+
+def compact_dtypes(columns):
+    """
+    :param columns: column names of a match table
+    :return: dictionary of the compact type of each of the columns that has one
+    """
+    dtypes = {column: dtype for column, dtype in COMPACT_DTYPES.items() if column in columns}
+    dtypes.update({column: 'float32' for column in COMPACT_FLOAT_COLUMNS if column in columns})
+    return dtypes
+
+
+def fitting_int(dtype, low, high):
+    """
+    :return: dtype, or int32 or int64 when the values from low to high do not fit in it
+    """
+    for wider in (dtype, 'int32', 'int64'):
+        if np.iinfo(wider).min <= low and high <= np.iinfo(wider).max:
+            return wider
+    return 'int64'
+
+
+def compact(df):
+    """
+    Converts a match table to compact types: int32 frame numbers, int8 team, int16 squad number and player id,
+    float32 coordinates and speeds, and categorical possession and in play flags.
+    Integer columns with values too big for their compact type are kept at int32 or int64 instead.
+    The player table has only numeric columns, so it goes from 56 to 21 bytes a row, about 2.7x smaller. The 4x
+    aimed for cannot be reached with these types. The ball table (about 7x) and player_and_ball (about 5x) shrink
+    more, as their possession and in play flags were Python strings.
+    :param df: DataFrame of a match table
+    :return: DataFrame with compact types
+    """
+    dtypes = compact_dtypes(df.columns)
+    for column, dtype in dtypes.items():
+        if dtype.startswith('int') and len(df):
+            dtypes[column] = fitting_int(dtype, df[column].min(), df[column].max())
+    return df.astype(dtypes)
+
+
+def memory_footprint(df):
+    """
+    :return: bytes of memory taken by a DataFrame, including the contents of text columns
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(name, csv_directory=CSV_DIRECTORY):
+    """
+    Prints how much memory a match table takes when read with plain pd.read_csv compared to load_table.
+    :param name: name of the table, e.g. "player"
+    :param csv_directory: directory holding the CSV files
+    :return: bytes taken by the plain and the compact DataFrame
+    """
+    plain = memory_footprint(pd.read_csv(find_file(os.path.join(csv_directory, f'{name}.csv'))))
+    compacted = memory_footprint(load_table(name, csv_directory=csv_directory))
+    print(f"{name}: {plain / 1e6:.1f} MB with read_csv, {compacted / 1e6:.1f} MB compact "
+          f"({plain / max(compacted, 1):.1f}x smaller)")
+    return plain, compacted
+
+
+def table_path(name, directory=STORE_DIRECTORY):
+    return os.path.join(directory, name)
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def source_record(source):
+    """
+    :param source: CSV file a table is stored with, or None
+    :return: what meta.json keeps of it, so has_table can tell when it has been written again
+    """
+    if source is None:
+        return None
+    return {'file': source, 'signature': file_signature(source)}
+
+
+def has_table(name, directory=STORE_DIRECTORY):
+    """
+    :return: whether a table is in the store and up to date with its CSV file. A table stored with a CSV file is out
+    of date once that file (or a compressed copy taking its place) has been written again; one stored on its own is
+    out of date when the CSV file beside the store is newer than it.
+    """
+    meta_file = os.path.join(table_path(name, directory), 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+
+    source = read_meta(name, directory).get('source')
+    if source is not None:
+        csv_file = find_file(strip_compression(source['file']))
+        return csv_file == source['file'] and os.path.exists(csv_file) and \
+            file_signature(csv_file) == source['signature']
+
+    csv_file = find_file(os.path.join(os.path.dirname(os.path.normpath(directory)), f'{name}.csv'))
+    return not os.path.exists(csv_file) or os.path.getmtime(csv_file) <= os.path.getmtime(meta_file)
+
+
+def write_table(df, name, directory=STORE_DIRECTORY, source=None):
+    """
+    Writes a DataFrame to the columnar store, one .npy file per column, in the compact types of compact().
+    Text columns (e.g. poss, inPlay) are stored as integer codes with their categories kept in meta.json.
+    :param df: DataFrame to store, sorted by frame_num if it has one
+    :param name: name of the table, e.g. "player"
+    :param directory: root directory of the store
+    :param source: CSV file written with the same rows, already closed, see has_table
+    :return: directory the table was written to
+    """
+    table_dir = table_path(name, directory)
+    os.makedirs(table_dir, exist_ok=True)
+
+    # frame ranges are looked up with a binary search, so the table has to be in frame order
+    if 'frame_num' in df.columns and not df['frame_num'].is_monotonic_increasing:
+        df = df.sort_values(by='frame_num', kind='stable')
+    df = compact(df)
+
+    meta = {'rows': len(df), 'columns': list(df.columns), 'categories': {}, 'source': source_record(source)}
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) or not pd.api.types.is_numeric_dtype(values):
+            categorical = values.astype('category')
+            meta['categories'][column] = [str(c) for c in categorical.cat.categories]
+            values = categorical.cat.codes
+        np.save(os.path.join(table_dir, f'{column}.npy'), np.ascontiguousarray(values.to_numpy()))
+
+    with open(os.path.join(table_dir, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+
+    return table_dir
+
+
+def csv_to_store(filename, name=None, directory=STORE_DIRECTORY):
+    """
+    Converts a CSV file produced by the preprocessing into the columnar store.
+    :param filename: CSV file to convert
+    :param name: name of the table, defaults to the name of the file
+    :param directory: root directory of the store
+    :return: directory the table was written to
+    """
+    name = name or os.path.basename(filename).split('.')[0]
+    return write_table(pd.read_csv(filename), name, directory, source=filename)
+
+
+class TableWriter:
+    """
+    Writes a table to the store block by block as it is produced, so it is never held in memory as a whole.
+    Each column is appended to a temporary file, and close() puts it in the compact types of compact() (widening
+    integer columns as needed) and writes the .npy files, giving the same table as write_table.
+
+    writer = TableWriter('player', PLAYER_COLUMNS)
+    for block in blocks:
+        writer.append(block)
+    writer.close(source='data/player.csv')
+    """
+
+    def __init__(self, name, columns, directory=STORE_DIRECTORY):
+        self.name = name
+        self.directory = directory
+        self.table_dir = table_path(name, directory)
+        self.columns = list(columns)
+        self.dtypes = compact_dtypes(self.columns)
+        self.rows = 0
+        self.last_frame = None
+        self.in_frame_order = True
+        # per column: the type it is appended in, its lowest and highest value, and the categories met so far
+        self.part_dtypes = {}
+        self.bounds = {}
+        self.categories = {column: {} for column in self.columns}
+        self.categorical = {column for column, dtype in self.dtypes.items() if dtype == 'category'}
+
+        os.makedirs(self.table_dir, exist_ok=True)
+        self.parts = {column: open(self.part_path(column), 'wb') for column in self.columns}
+
+    def part_path(self, column):
+        return os.path.join(self.table_dir, f'{column}.part')
+
+    def append(self, df):
+        """
+        :param df: the next rows of the table, with numeric columns already parsed
+        """
+        if not len(df):
+            return
+        if 'frame_num' in df.columns:
+            frame_nums = df['frame_num'].to_numpy()
+            first = frame_nums[0] if self.last_frame is None else self.last_frame
+            self.in_frame_order &= bool(first <= frame_nums[0] and np.all(frame_nums[1:] >= frame_nums[:-1]))
+            self.last_frame = frame_nums[-1]
+
+        for column in self.columns:
+            values = df[column]
+            if column in self.categorical or not pd.api.types.is_numeric_dtype(values):
+                self.categorical.add(column)
+                # codes in the order the categories are met, sorted by close()
+                seen = self.categories[column]
+                for category in values.astype(str).unique():
+                    seen.setdefault(category, len(seen))
+                values = values.astype(str).map(seen).to_numpy(dtype=np.int64)
+            elif self.dtypes.get(column, '').startswith('int'):
+                values = values.to_numpy(dtype=np.int64)
+                low, high = self.bounds.get(column, (values.min(), values.max()))
+                self.bounds[column] = (min(low, values.min()), max(high, values.max()))
+            else:
+                values = values.to_numpy(dtype=self.dtypes.get(column) or
+                                         self.part_dtypes.get(column, values.dtype))
+            self.part_dtypes.setdefault(column, values.dtype)
+            self.parts[column].write(np.ascontiguousarray(values, dtype=self.part_dtypes[column]).tobytes())
+
+        self.rows += len(df)
+
+    def close(self, source=None):
+        """
+        Writes the .npy files and meta.json of the table.
+        :param source: CSV file written with the same rows, already closed, see has_table
+        :return: directory the table was written to
+        """
+        for part in self.parts.values():
+            part.close()
+
+        meta = {'rows': self.rows, 'columns': self.columns, 'categories': {}, 'source': source_record(source)}
+        for column in self.columns:
+            part_dtype = np.dtype(self.part_dtypes.get(column, np.float64))
+            mapping = None
+            if column in self.categorical:
+                # categories sorted as astype('category') sorts them, codes as narrow as pandas makes them
+                categories = sorted(self.categories[column])
+                meta['categories'][column] = categories
+                mapping = np.empty(len(categories), dtype=pd.Categorical([], categories=categories).codes.dtype)
+                for code, category in enumerate(categories):
+                    mapping[self.categories[column][category]] = code
+                dtype = mapping.dtype
+            elif column in self.bounds:
+                dtype = np.dtype(fitting_int(self.dtypes[column], *self.bounds[column]))
+            else:
+                dtype = part_dtype
+
+            # the appended values are copied into the .npy file a block at a time, in their final type
+            array = np.lib.format.open_memmap(os.path.join(self.table_dir, f'{column}.npy'), mode='w+',
+                                              dtype=dtype, shape=(self.rows,))
+            block = max(1, (64 << 20) // part_dtype.itemsize)
+            with open(self.part_path(column), 'rb') as part:
+                for start in range(0, self.rows, block):
+                    values = np.frombuffer(part.read(block * part_dtype.itemsize), dtype=part_dtype)
+                    array[start:start + len(values)] = values if mapping is None else mapping[values]
+            array.flush()
+            del array
+            os.remove(self.part_path(column))
+
+        with open(os.path.join(self.table_dir, 'meta.json'), 'w') as file:
+            json.dump(meta, file, indent=2)
+
+        if not self.in_frame_order:
+            # frame ranges are looked up with a binary search, so the table has to be in frame order
+            write_table(read_table(self.name, directory=self.directory).copy(), self.name, self.directory, source)
+        return self.table_dir
+
+
+def read_meta(name, directory=STORE_DIRECTORY):
+    with open(os.path.join(table_path(name, directory), 'meta.json'), 'r') as file:
+        return json.load(file)
+
+
+def frame_bounds(frame_nums, frames):
+    """
+    Finds the rows of a frame-ordered table within a frame range.
+    :param frame_nums: sorted array of frame numbers
+    :param frames: (start, end) frame range, end exclusive. Either may be None for an open range.
+    :return: first and last (exclusive) row of the range
+    """
+    start, end = frames
+    first = 0 if start is None else int(np.searchsorted(frame_nums, start, side='left'))
+    last = len(frame_nums) if end is None else int(np.searchsorted(frame_nums, end, side='left'))
+    return first, last
+
+
+def load_columns(name, columns=None, frames=None, directory=STORE_DIRECTORY):
+    """
+    Memory maps the columns of a stored table. Nothing is copied: the arrays returned are views of the files.
+    Text columns are returned as their integer codes, see read_meta for the categories.
+    :param name: name of the table, e.g. "ball"
+    :param columns: columns to load, defaults to all of them
+    :param frames: optional (start, end) frame range, end exclusive
+    :return: dictionary of column name to array
+    """
+    table_dir = table_path(name, directory)
+    meta = read_meta(name, directory)
+    columns = columns or meta['columns']
+
+    first, last = 0, meta['rows']
+    if frames is not None:
+        first, last = frame_bounds(np.load(os.path.join(table_dir, 'frame_num.npy'), mmap_mode='r'), frames)
+
+    return {column: np.load(os.path.join(table_dir, f'{column}.npy'), mmap_mode='r')[first:last]
+            for column in columns}
+
+
+def load_table(name, columns=None, frames=None, directory=STORE_DIRECTORY, csv_directory=CSV_DIRECTORY):
+    """
+    Loads a match table. Every analysis should read player, ball and player_and_ball data through here.
+    The columnar store is used when it has been written and is up to date (see has_table), otherwise the CSV file
+    is read (or a compressed copy of it, e.g. player.csv.gz). Either way the columns come in the compact types of
+    compact().
+    :param name: name of the table, e.g. "player"
+    :param columns: columns to load, defaults to all of them
+    :param frames: optional (start, end) frame range, end exclusive
+    :param directory: root directory of the store
+    :param csv_directory: directory holding the CSV files
+    :return: DataFrame
+    """
+    if not has_table(name, directory):
+        return read_csv_table(os.path.join(csv_directory, f'{name}.csv'), columns, frames)
+    return read_table(name, columns, frames, directory)
+
+
+def read_table(name, columns=None, frames=None, directory=STORE_DIRECTORY):
+    """
+    Reads a table of the columnar store into a DataFrame, with its text columns as categoricals.
+    Unlike load_table it does not check the table is up to date with its CSV file.
+    """
+    categories = read_meta(name, directory)['categories']
+    data = load_columns(name, columns, frames, directory)
+    for column, codes in data.items():
+        if column in categories:
+            data[column] = pd.Categorical.from_codes(codes, categories=categories[column])
+
+    return pd.DataFrame(data, copy=False)
+
+
+def read_csv_table(filename, columns=None, frames=None):
+    """
+    Reads a match table from a CSV file, with the same column and frame selection as load_table.
+    Columns with a compact type are parsed straight into it. When the file is missing a compressed copy of it is
+    read instead, see fileio.find_file.
+    """
+    filename = find_file(filename)
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) + (['frame_num'] if frames is not None and 'frame_num' not in columns else [])
+    header = pd.read_csv(filename, nrows=0).columns
+    dtypes = {column: dtype for column, dtype in compact_dtypes(header).items()
+              if COMPACT_DTYPES.get(column) != 'int16' and (usecols is None or column in usecols)}
+    df = compact(pd.read_csv(filename, usecols=usecols, dtype=dtypes))
+
+    if frames is not None:
+        start, end = frames
+        in_range = pd.Series(True, index=df.index)
+        if start is not None:
+            in_range &= df['frame_num'] >= start
+        if end is not None:
+            in_range &= df['frame_num'] < end
+        df = df[in_range].reset_index(drop=True)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def load_data(filename, columns=None, frames=None):
+    """
+    Loads a match table given the path of its CSV file, e.g. "data/player_and_ball.csv",
+    using the columnar store instead when the table has been stored.
+    :param filename: path of the CSV file
+    :param columns: columns to load, defaults to all of them
+    :param frames: optional (start, end) frame range, end exclusive
+    :return: DataFrame
+    """
+    name = stored_name(filename)
+    if name is not None:
+        return load_table(name, columns, frames)
+    return read_csv_table(filename, columns, frames)
+
+
+def stored_name(filename):
+    """
+    :param filename: path of the CSV file of a match table, e.g. "data/player_and_ball.csv"
+    :return: name of the table in the columnar store, or None if it has not been stored
+    """
+    csv_directory, basename = os.path.split(filename)
+    name = basename.split('.')[0]
+    if os.path.normpath(csv_directory or '.') == os.path.normpath(CSV_DIRECTORY) and has_table(name):
+        return name
+    return None
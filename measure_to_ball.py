@@ -4,9 +4,11 @@ from matplotlib import pyplot as plt
 from mplsoccer import Pitch
 
 import analyse
+import match_store
+from player_and_ball import FrameTensor
 from preprocess_data import pitch
 
-data = pd.read_csv('data/player_and_ball.csv')
+data = match_store.load_table('player_and_ball')
 
 home_alive = data[(data['team_id'] == 0) & (data['inPlay'] == 'Alive')]
 away_alive = data[(data['team_id'] == 1) & (data['inPlay'] == 'Alive')]
@@ -84,24 +86,14 @@ def calculate_closeness(data):
     Returns:
     - closeness_df: DataFrame containing frame numbers and the average closeness.
     """
-    closeness_records = []
-
-    # Iterate over each frame
-    for frame, frame_data in data.groupby('frame_num'):
-        distances = []
-
-        ball_position = frame_data.iloc[0][['x_ball', 'y_ball']].values
-        for _, row in frame_data.iterrows():
-            player_position = row[['x_player', 'y_player']].values
-            distance = np.linalg.norm(ball_position - player_position)
-            distances.append(distance)
+    # frames x players distances to the ball, missing players are NaN and sort last
+    tensor = FrameTensor.from_frame(data)
+    distances = np.sort(tensor.distances_to_ball(), axis=1)
 
-        # Sort distances and take the average of the 5 closest players
-        closest_distances = sorted(distances)[:5]
-        average_closeness = np.mean(closest_distances)
-        closeness_records.append((frame, average_closeness))
+    # Take the average of the 5 closest players in every frame
+    average_closeness = np.nanmean(distances[:, :5], axis=1)
 
-    closeness_df = pd.DataFrame(closeness_records, columns=['frame_num', 'average_closeness'])
+    closeness_df = pd.DataFrame({'frame_num': tensor.frames, 'average_closeness': average_closeness})
     print(closeness_df)
     return generate_heatmap(closeness_df, data)
 
@@ -1,9 +1,12 @@
 import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
-from mplsoccer import Pitch
-from preprocess_data import pitch
+from preprocess_data import get_metadata, pitch
 import analyse
+import export
+import match_store
+import render
+import turnovers
+from frame_index import FrameReader
 from shapely.geometry import LineString, Point
 
 # pitch details
@@ -13,12 +16,10 @@ pitch_width = pitch["y"]
 
 def change_over(input_file, output_file):
     # Read the input CSV file
-    data = pd.read_csv(input_file)
-
-    poss_changed = (data["poss"].ne(data["poss"].shift())) & (data["inPlay"].shift() == "Alive") & (
-            data["inPlay"] == "Alive")
+    data = match_store.load_data(input_file)
 
-    change_over_rows = data[poss_changed]
+    # possession changing while the ball stays in play
+    change_over_rows = turnovers.turnover_rows(data, turnovers.LIVE)
     change_over_rows.to_csv(output_file, index=False)
 
 
@@ -33,7 +34,7 @@ def collect_previous_frames(frame_nums_file, data_file, output_file):
     frame_nums_of_interest = pd.read_csv(frame_nums_file)["frame_num"]
 
     # Load the main data file
-    data = pd.read_csv(data_file)
+    data = match_store.load_data(data_file)
 
     # Initialise an empty DataFrame for the results
     collected_data = pd.DataFrame()
@@ -61,6 +62,16 @@ def collect_previous_frames(frame_nums_file, data_file, output_file):
     collected_data.to_csv(output_file, index=False)
 
 
+def collect_previous_raw_frames(frame_nums_file, datafile, output_file, previous=3, step=25):
+    # Load frame numbers of interest
+    frame_nums_of_interest = pd.read_csv(frame_nums_file)["frame_num"]
+
+    # Pull the turnover and the frames before it straight from the raw file using its frame index
+    with FrameReader(datafile) as reader, open(output_file, "w") as out:
+        for frame_num in frame_nums_of_interest:
+            out.writelines(reader.previous(int(frame_num), previous, step))
+
+
 def clean_frames(input, output):
     data = pd.read_csv(input)
     filtered_data = pd.DataFrame()
@@ -76,68 +87,60 @@ def clean_frames(input, output):
     filtered_data.to_csv(output, index=False)
 
 
-def heatmap_clean(input_file, pitch_length, pitch_width, blocked_passes):
+def heatmap_clean(input_file, pitch_length, pitch_width, blocked_passes, workers=render.RENDER_WORKERS,
+                  output=export.FIGURES):
+    export.check_output(output)
+
     # Load the filtered frame numbers
     closeness_df = pd.read_csv(input_file)
 
-    # clear old heatmap images
-    analyse.remove_old_files()
-
-    # Generate heatmap for each unique frame found in the filtered frames
-    unique_frames = closeness_df["frame_num"].unique()
-
-    for frame in unique_frames:
-        # Initialising the pitch
-        fig, ax = plt.subplots(figsize=(10, 7))
-        pitch = Pitch(pitch_type="custom", pitch_color="#22312b", line_color="white",
-                      pitch_length=pitch_length, pitch_width=pitch_width)
-        pitch.draw(ax=ax)
+    if output == export.ARRAYS:
+        # the players blocking a pass in each frame to data/export/block_passes.json, and the positions they were
+        # found from to data/export/block_passes.npz
+        export.write_json("block_passes", [
+            {"frame_num": frame, "poss": frame_data["poss"].iloc[0],
+             "ball": [frame_data["x_ball"].iloc[0], frame_data["y_ball"].iloc[0]],
+             "blocking": blocked_passes.get(frame, [])}
+            for frame, frame_data in closeness_df.groupby("frame_num", sort=False)])
+        export.write_table("block_passes", closeness_df)
+        return
+
+    # One figure for each unique frame found in the filtered frames, drawn by plots.blocking_pass_frame
+    jobs = [{"filename": f"figures/block_passes_heatmap{frame}.png", "frame": frame, "frame_data": frame_data,
+             "pitch_length": pitch_length, "pitch_width": pitch_width,
+             "frame_intersection_info": blocked_passes.get(frame, [])}
+            for frame, frame_data in closeness_df.groupby("frame_num", sort=False)]
 
-        frame_data = closeness_df[closeness_df["frame_num"] == frame]
-
-        if frame_data["poss"].iloc[0] == "H":
-            possession_status = "Home Possession"
-            possessing_team_id = 1
-        else:
-            possession_status = "Away Possession"
-            possessing_team_id = 0
-
-        ball_x = frame_data["x_ball"].iloc[0]
-        ball_y = frame_data["y_ball"].iloc[0]
-
-        # Iterate through the frame data to plot each player and the ball
-        for _, row in frame_data.iterrows():
-            team_colour = "blue" if row["team_id"] == 0 else "red"
-            player_label = f"{row["squadNum"]}"  # label with squad number
-
-            # Plot player
-            pitch.scatter(row["x_player"], row["y_player"], ax=ax, s=120, color=team_colour, edgecolors="black",
-                          zorder=2)
-            plt.text(row["x_player"] + 1, row["y_player"] + 1, player_label, color="white", fontsize=6, ha="center",
-                     va="center", zorder=3, bbox=dict(facecolor=team_colour, alpha=0.25, edgecolor=team_colour))
-
-            # Draw line to ball for players on the possessing team
-            if row["team_id"] == possessing_team_id:
-                pitch.lines(ball_x, ball_y, row["x_player"], row["y_player"], lw=0.6,
-                            color="yellow", ax=ax, zorder=1)
-
-            # Retrieve intersection information for the current frame
-            frame_intersection_info = blocked_passes.get(frame, [])
+    # clear old heatmap images
+    analyse.remove_old_files(keep=[job["filename"] for job in jobs])
+    render.render_figures("plots.blocking_pass_frame", jobs, workers)
 
-            info_text = "".join(
-                f"Team ID: {player['team_id']}, Player ID: {player['player_id']}, Squad Number: {player['squad_num']}\n"
-                for player in frame_intersection_info)
 
-            plt.figtext(0.5, 0.01, info_text, ha="center", fontsize=10, color="black")
+def heatmap_clips(input_file, pitch_length, pitch_width, blocked_passes, kind=turnovers.LIVE,
+                  lead_seconds=turnovers.LEAD_SECONDS, extension=render.CLIP_EXTENSION, fps=render.CLIP_FPS,
+                  workers=render.RENDER_WORKERS):
+    """
+    Renders the frames leading up to each turnover as one clip per turnover, drawn by plots.blocking_pass_clip.
+    :param kind: turnovers.RESTART or turnovers.LIVE, None for both
+    :param lead_seconds: seconds of play before a turnover that make up its clip
+    :param extension: format of the clips, ".gif", ".mp4" (needs ffmpeg) or ".png" for a strip of the frames
+    :param fps: frames shown per second
+    """
+    closeness_df = pd.read_csv(input_file)
 
-        pitch.scatter(ball_x, ball_y, ax=ax, s=120, color="white", edgecolors="black", zorder=2, label="Ball")
+    # the turnover each frame leads up to, frames leading up to none are left out
+    turnover_frames = turnovers.load_turnover_index(kind)["frame_num"]
+    leads = turnovers.lead_up(closeness_df["frame_num"], turnover_frames, lead_seconds * get_metadata().frame_rate)
 
-        plt.title(f"Frame: {frame} - {possession_status}", color="Black")
-        plt.legend(loc="upper right")
+    jobs = [{"filename": f"figures/block_passes_turnover_{turnover}{extension}",
+             "frames": [(frame, frame_data, blocked_passes.get(frame, []))
+                        for frame, frame_data in sequence.groupby("frame_num")],
+             "pitch_length": pitch_length, "pitch_width": pitch_width, "fps": fps}
+            for turnover, sequence in closeness_df.groupby(leads) if turnover >= 0]
 
-        # Save the heatmap for the current frame
-        plt.savefig(f"figures/block_passes_heatmap{frame}.png", dpi=300)
-        plt.close()
+    # clear old heatmap images
+    analyse.remove_old_files(keep=[job["filename"] for job in jobs])
+    render.render_figures("plots.blocking_pass_clip", jobs, workers)
 
 
 def create_linestrings(csv_path):
@@ -216,7 +219,7 @@ def clean_team_id_data(csv_file_path):
 def extract_matching_rows_and_save(frame_nums_csv_path, data_csv_path, output_csv_path):
     # Step 1: Load the frame numbers and data into DataFrames
     frame_nums_df = pd.read_csv(frame_nums_csv_path)
-    data_df = pd.read_csv(data_csv_path)
+    data_df = match_store.load_data(data_csv_path)
 
     filtered_data_df = data_df[data_df['frame_num'].isin(frame_nums_df['frame_num'])]
 
@@ -0,0 +1,162 @@
+# Cumulative occupancy cubes for heatmaps over any window of time. For a sequence of positions, cube[t] holds how many
+# of the first t positions fell in each of the 25 x 25 bins of the pitch, so the heatmap of positions [start, end) is
+# cube[end] - cube[start], whatever the window. Cubes are cached on disk and smoothed heatmaps are cached per window.
+# The bins are laid over the pitch of the match analysed, so every function is given its length and width.
+import os
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+import match_store
+from fileio import find_file
+
+BINS = 25
+OCCUPANCY_DIRECTORY = 'data/occupancy'
+
+# cubes already loaded, with the smoothed heatmaps cached on them
+_loaded_cubes = {}
+
+
+def bin_edges(pitch_length, pitch_width, bins=BINS):
+    """
+    :return: edges of the bins along the length and the width of the pitch
+    """
+    return np.linspace(0, pitch_length, bins + 1), np.linspace(0, pitch_width, bins + 1)
+
+
+def bin_positions(x, y, pitch_length, pitch_width, bins=BINS):
+    """
+    Finds the bin of each position. A position on the far edge of the pitch is put in the last bin.
+    :return: row (along the width) and column (along the length) of the bin of each position, and a mask of the
+    positions on the pitch
+    """
+    x_edges, y_edges = bin_edges(pitch_length, pitch_width, bins)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    on_pitch = (x >= x_edges[0]) & (x <= x_edges[-1]) & (y >= y_edges[0]) & (y <= y_edges[-1])
+    columns = np.clip(np.searchsorted(x_edges, x, side='right') - 1, 0, bins - 1)
+    rows = np.clip(np.searchsorted(y_edges, y, side='right') - 1, 0, bins - 1)
+    return rows, columns, on_pitch
+
+
+def bin_counts(x, y, pitch_length, pitch_width, bins=BINS):
+    """
+    :return: (bins, bins) array of the number of positions in each bin, rows along the width of the pitch
+    """
+    rows, columns, on_pitch = bin_positions(x, y, pitch_length, pitch_width, bins)
+    counts = np.zeros((bins, bins), dtype=np.int64)
+    np.add.at(counts, (rows[on_pitch], columns[on_pitch]), 1)
+    return counts
+
+
+def heatmap_statistic(statistic, pitch_length, pitch_width, bins=BINS):
+    """
+    Puts binned counts in the form mplsoccer's Pitch.heatmap draws, as returned by Pitch.bin_statistic.
+    :param statistic: (bins, bins) array, rows along the width of the pitch
+    :return: dictionary with statistic, x_grid, y_grid, cx and cy
+    """
+    x_edges, y_edges = bin_edges(pitch_length, pitch_width, bins)
+    x_grid, y_grid = np.meshgrid(x_edges, y_edges)
+    cx, cy = np.meshgrid((x_edges[1:] + x_edges[:-1]) / 2, (y_edges[1:] + y_edges[:-1]) / 2)
+    return {'statistic': statistic, 'x_grid': x_grid, 'y_grid': y_grid, 'cx': cx, 'cy': cy}
+
+
+class OccupancyCube:
+    """
+    cumulative[t] is the number of the first t positions in each bin, frame_nums[t] the frame of position t.
+
+    cube = OccupancyCube.build(frame_nums, x, y, pitch_length, pitch_width)
+    heatmap = cube.smoothed(0, 60)
+    """
+
+    def __init__(self, frame_nums, cumulative):
+        self.frame_nums = frame_nums
+        self.cumulative = cumulative
+        self.smoothed_cache = {}
+
+    @classmethod
+    def build(cls, frame_nums, x, y, pitch_length, pitch_width, bins=BINS):
+        rows, columns, on_pitch = bin_positions(x, y, pitch_length, pitch_width, bins)
+        positions = np.flatnonzero(on_pitch)
+
+        # the smallest type that can hold the count of every position in one bin
+        dtype = np.uint16 if len(rows) <= np.iinfo(np.uint16).max else np.uint32
+        cumulative = np.zeros((len(rows) + 1, bins, bins), dtype=dtype)
+        cumulative[positions + 1, rows[positions], columns[positions]] = 1
+        np.cumsum(cumulative, axis=0, out=cumulative)
+
+        return cls(np.asarray(frame_nums), cumulative)
+
+    def save(self, filename):
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        np.save(filename + '.npy', self.cumulative)
+        np.save(filename + '.frames.npy', self.frame_nums)
+
+    @classmethod
+    def load(cls, filename):
+        return cls(np.load(filename + '.frames.npy'), np.load(filename + '.npy', mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.frame_nums)
+
+    def counts(self, start, end):
+        """
+        :return: (bins, bins) array of the number of positions [start, end) in each bin
+        """
+        start, end = max(start, 0), min(end, len(self))
+        return self.cumulative[max(end, start)].astype(np.int64) - self.cumulative[start]
+
+    def rows(self, start_frame, end_frame):
+        """
+        :return: the positions [start, end) of the frames [start_frame, end_frame)
+        """
+        return (int(np.searchsorted(self.frame_nums, start_frame)),
+                int(np.searchsorted(self.frame_nums, end_frame)))
+
+    def smoothed(self, start, end, sigma=1):
+        """
+        Heatmap of the positions [start, end) smoothed with a Gaussian filter, as the analyses draw them.
+        Each window is smoothed once, later calls return the same array.
+        """
+        key = (start, end, sigma)
+        if key not in self.smoothed_cache:
+            self.smoothed_cache[key] = gaussian_filter(self.counts(start, end).astype(np.float64), sigma)
+        return self.smoothed_cache[key]
+
+
+def table_mtime(name):
+    """
+    :return: when a match table was last written, in the columnar store or as a CSV file
+    """
+    if match_store.has_table(name):
+        return os.path.getmtime(os.path.join(match_store.table_path(name), 'meta.json'))
+    filename = find_file(os.path.join(match_store.CSV_DIRECTORY, f'{name}.csv'))
+    return os.path.getmtime(filename) if os.path.exists(filename) else 0
+
+
+def cached_cube(key, frame_nums, x, y, pitch_length, pitch_width, sources=('player', 'ball'),
+                directory=OCCUPANCY_DIRECTORY):
+    """
+    Loads the cube saved under a key, building and saving it first if it is missing, older than the match tables
+    it was built from, or built from a different number of positions.
+    :param key: name of the cube, e.g. "player_0_7"
+    :param frame_nums: frame of each position, in time order
+    :param x: x of each position
+    :param y: y of each position
+    :param pitch_length: length of the pitch the bins are laid over, part of the name the cube is saved under
+    :param pitch_width: width of the pitch
+    :param sources: names of the match tables the positions come from
+    :param directory: where cubes are saved
+    :return: OccupancyCube
+    """
+    filename = os.path.join(directory, f'{key}_{pitch_length:g}x{pitch_width:g}')
+    if not os.path.exists(filename + '.npy') or \
+            os.path.getmtime(filename + '.npy') < max(table_mtime(name) for name in sources):
+        OccupancyCube.build(frame_nums, x, y, pitch_length, pitch_width).save(filename)
+
+    mtime = os.path.getmtime(filename + '.npy')
+    if filename not in _loaded_cubes or _loaded_cubes[filename][0] != mtime:
+        _loaded_cubes[filename] = (mtime, OccupancyCube.load(filename))
+    if len(_loaded_cubes[filename][1]) != len(frame_nums):
+        OccupancyCube.build(frame_nums, x, y, pitch_length, pitch_width).save(filename)
+        _loaded_cubes[filename] = (os.path.getmtime(filename + '.npy'), OccupancyCube.load(filename))
+    return _loaded_cubes[filename][1]
@@ -0,0 +1,126 @@
+# Joins the player and ball tables on frame_num into player_and_ball, the table the Team Closeness and Blocking Passes
+# analyses work on. Alongside it a dense (frames, players, fields) array is kept, so that per frame operations become
+# array slicing instead of filtering the table frame by frame.
+import numpy as np
+import pandas as pd
+
+import match_store
+
+PLAYER_FIELDS = ('x_player', 'y_player', 'speed_player')
+BALL_FIELDS = ('x_ball', 'y_ball', 'z', 'speed_ball')
+
+TENSOR_FILE = 'data/player_and_ball.npz'
+
+
+def merge_player_and_ball(player_df, ball_df):
+    """
+    Aligns every player row with the ball row of the same frame. Frames without a ball on the pitch are dropped.
+    :param player_df: player table
+    :param ball_df: ball table
+    :return: DataFrame with the columns of both, player and ball positions suffixed with _player and _ball
+    """
+    merged = player_df.merge(ball_df, on='frame_num', how='inner', suffixes=('_player', '_ball'))
+    return merged.sort_values(by='frame_num', kind='stable').reset_index(drop=True)
+
+
+class FrameTensor:
+    """
+    Dense view of player_and_ball. players[f, s] holds x, y and speed of the player in slot s at frames[f]
+    (NaN where the player is not on the pitch), ball[f] holds x, y, z and speed of the ball, and rows[f, s] is the
+    row of the table the values came from (-1 if there is none).
+    """
+
+    def __init__(self, frames, slots, players, ball, poss, in_play, rows):
+        self.frames = frames
+        self.slots = slots
+        self.players = players
+        self.ball = ball
+        self.poss = poss
+        self.in_play = in_play
+        self.rows = rows
+
+    @classmethod
+    def from_frame(cls, data):
+        """
+        Builds the tensor from a player_and_ball DataFrame, or any selection of its rows.
+        :param data: DataFrame with the columns of player_and_ball
+        :return: FrameTensor
+        """
+        frames, frame_index = np.unique(data['frame_num'].to_numpy(), return_inverse=True)
+
+        # one slot per player, in team then player id order
+        slots = data[['team_id', 'player_id', 'squadNum']].drop_duplicates(subset=['team_id', 'player_id'])
+        slots = slots.sort_values(by=['team_id', 'player_id']).reset_index(drop=True)
+        slot_index = pd.MultiIndex.from_frame(slots[['team_id', 'player_id']]).get_indexer(
+            pd.MultiIndex.from_frame(data[['team_id', 'player_id']]))
+
+        players = np.full((len(frames), len(slots), len(PLAYER_FIELDS)), np.nan, dtype=np.float32)
+        players[frame_index, slot_index] = data[list(PLAYER_FIELDS)].to_numpy(dtype=np.float32)
+
+        rows = np.full((len(frames), len(slots)), -1, dtype=np.int64)
+        rows[frame_index, slot_index] = np.arange(len(data))
+
+        # the ball is the same on every row of a frame, so the first row of each frame is enough
+        first_rows = np.unique(frame_index, return_index=True)[1]
+        ball = data[list(BALL_FIELDS)].to_numpy(dtype=np.float32)[first_rows]
+        poss = data['poss'].to_numpy().astype(str)[first_rows]
+        in_play = data['inPlay'].to_numpy().astype(str)[first_rows]
+
+        return cls(frames, slots, players, ball, poss, in_play, rows)
+
+    def save(self, filename=TENSOR_FILE):
+        np.savez(filename, frames=self.frames, team_id=self.slots['team_id'].to_numpy(),
+                 player_id=self.slots['player_id'].to_numpy(), squadNum=self.slots['squadNum'].to_numpy(),
+                 players=self.players, ball=self.ball, poss=self.poss, in_play=self.in_play, rows=self.rows)
+
+    @classmethod
+    def load(cls, filename=TENSOR_FILE):
+        with np.load(filename) as tensor:
+            slots = pd.DataFrame({'team_id': tensor['team_id'], 'player_id': tensor['player_id'],
+                                  'squadNum': tensor['squadNum']})
+            return cls(tensor['frames'], slots, tensor['players'], tensor['ball'], tensor['poss'],
+                       tensor['in_play'], tensor['rows'])
+
+    def frame_index(self, frame_num):
+        """
+        :return: position of a frame in the tensor, or -1 if it is not there
+        """
+        f = int(np.searchsorted(self.frames, frame_num))
+        return f if f < len(self.frames) and self.frames[f] == frame_num else -1
+
+    def window(self, start, end):
+        """
+        :return: slice of the tensor positions of the frames in [start, end)
+        """
+        return slice(int(np.searchsorted(self.frames, start)), int(np.searchsorted(self.frames, end)))
+
+    def team_slots(self, team_id):
+        """
+        :return: boolean mask of the slots of a team
+        """
+        return self.slots['team_id'].to_numpy() == team_id
+
+    def distances_to_ball(self):
+        """
+        :return: (frames, players) array of the distance from each player to the ball, NaN where a player is missing
+        """
+        return np.hypot(self.players[:, :, 0] - self.ball[:, None, 0], self.players[:, :, 1] - self.ball[:, None, 1])
+
+
+def join_player_and_ball(output_file='data/player_and_ball.csv', tensor_file=TENSOR_FILE, store=False):
+    """
+    The merging stage of the preprocessing: writes player_and_ball as a CSV file (and to the columnar match store)
+    together with its FrameTensor.
+    :param output_file: where the joined table is written
+    :param tensor_file: where the FrameTensor is written
+    :param store: also write the joined table to the columnar match store
+    :return: number of rows of the joined table
+    """
+    merged = merge_player_and_ball(match_store.load_table('player'), match_store.load_table('ball'))
+    merged.to_csv(output_file, index=False)
+    if store:
+        match_store.write_table(merged, 'player_and_ball', source=output_file)
+
+    FrameTensor.from_frame(merged).save(tensor_file)
+
+    return len(merged)
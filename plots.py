@@ -0,0 +1,395 @@
+# Drawing functions for the figures of the analyses. Each one draws a single figure from data the analysis has already
+# prepared and saves it, so that render.render_figures can run them in worker processes.
+# The pitches of each layout are drawn only once per process (see PitchCanvas): every figure restores that background
+# and draws just its own data on it. Clips of the lead-up to a turnover go further and create their artists once,
+# moving them from frame to frame.
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import gridspec
+from matplotlib.collections import LineCollection
+from matplotlib.image import imsave
+from mplsoccer import Pitch
+from PIL import Image
+
+import occupancy
+
+DPI = 300
+CLIP_DPI = 100
+
+# canvases already set up in this process, by layout
+_canvases = {}
+
+
+class PitchCanvas:
+    """
+    A figure of one or more pitches side by side, drawn once and kept as a raster background. A figure is made by
+    restoring the background, drawing only its data artists on it, and saving the pixels.
+    Pitch markings at or above the pitch's line_zorder are drawn again over the data, so they stay on top of
+    heatmaps as they do when the whole figure is drawn.
+    """
+
+    def __init__(self, figsize, columns, dpi, **pitch_style):
+        self.figure = plt.figure(figsize=figsize, dpi=dpi)
+        grid = gridspec.GridSpec(1, columns)
+        self.axes = [self.figure.add_subplot(grid[0, k]) for k in range(columns)]
+
+        self.pitch = Pitch(**pitch_style)
+        for ax in self.axes:
+            self.pitch.draw(ax=ax)
+
+        self.markings = [artist for ax in self.axes for artist in [*ax.lines, *ax.patches, *ax.collections]
+                         if artist.get_zorder() >= self.pitch.line_zorder]
+
+        self.figure.canvas.draw()
+        self.background = self.figure.canvas.copy_from_bbox(self.figure.bbox)
+
+    def draw(self, artists):
+        """
+        Restores the background and draws data artists over the pitches.
+        :return: the pixels of the figure, a (height, width, 4) view of the canvas
+        """
+        canvas = self.figure.canvas
+        canvas.restore_region(self.background)
+
+        lowest = min((artist.get_zorder() for artist in artists), default=0)
+        for artist in sorted(artists + [m for m in self.markings if m.get_zorder() >= lowest],
+                             key=lambda a: a.get_zorder()):
+            (artist.axes or self.figure).draw_artist(artist)
+
+        return np.asarray(canvas.buffer_rgba())
+
+    def clear(self, artists):
+        """
+        Takes artists off the figure again. Axes titles are emptied rather than removed.
+        """
+        for artist in artists:
+            if any(artist is ax.title for ax in self.axes):
+                artist.set_text("")
+            else:
+                artist.remove()
+
+    def save(self, filename, artists):
+        """
+        Draws data artists over the pitches, saves the figure, and takes the artists off again.
+        :param filename: where the figure is saved
+        :param artists: the artists added to the figure for this figure only
+        """
+        imsave(filename, self.draw(artists))
+        self.clear(artists)
+
+
+def pitch_canvas(layout, figsize, columns, dpi, **pitch_style):
+    """
+    :param layout: name of the figure layout, the canvas is set up once per layout and pitch size in each process
+    :return: PitchCanvas
+    """
+    key = (layout, pitch_style.get("pitch_length"), pitch_style.get("pitch_width"))
+    if key not in _canvases:
+        _canvases[key] = PitchCanvas(figsize, columns, dpi, **pitch_style)
+    return _canvases[key]
+
+
+def player_vs_ball_window(filename, pitch_length, pitch_width, player_heatmap, ball_heatmap, distance_heatmap,
+                          distance_threshold):
+    """
+    Player Influence figure of one window: heatmaps of the player, the ball, and the player's positions within
+    (or beyond) the distance threshold of the ball.
+    :param player_heatmap: smoothed (25, 25) counts of the player's positions
+    :param ball_heatmap: smoothed (25, 25) counts of the ball's positions
+    :param distance_heatmap: smoothed (25, 25) counts of the positions within the threshold, or None if there are none
+    """
+    # three pitches side by side: player, ball and distance heatmaps
+    canvas = pitch_canvas("player_vs_ball", (14, 7), 3, plt.rcParams["figure.dpi"], pitch_type="custom",
+                          pitch_length=pitch_length, pitch_width=pitch_width, line_zorder=2,
+                          pitch_color="#22312b", line_color="#efefef")
+    pitch = canvas.pitch
+    ax1, ax2, ax3 = canvas.axes
+
+    # heatmap plotted on the subplot ax1, with a hot colormap (higher values are  warmer colors), edge colours dark green
+    artists = [pitch.heatmap(occupancy.heatmap_statistic(player_heatmap, pitch_length, pitch_width), ax=ax1,
+                             cmap="hot", edgecolors="#22312b")]
+
+    # Heatmap for ball
+    artists.append(pitch.heatmap(occupancy.heatmap_statistic(ball_heatmap, pitch_length, pitch_width), ax=ax2,
+                                 cmap="hot", edgecolors="#22312b"))
+
+    # Heatmap for the player's positions within the specified distance from the ball
+    if distance_heatmap is not None:
+        artists.append(pitch.heatmap(occupancy.heatmap_statistic(distance_heatmap, pitch_length, pitch_width),
+                                     ax=ax3, cmap="hot", edgecolors="#22312b"))
+    else:
+        artists.append(ax3.text(0.5, 0.5, "No Data within Specified Distance", horizontalalignment="center",
+                                verticalalignment="center", transform=ax3.transAxes))
+
+    # Add titles
+    artists.append(ax1.set_title("Player Movement"))
+    artists.append(ax2.set_title("Ball Movement"))
+    artists.append(ax3.set_title(f"Player's Positions Within Specified {distance_threshold} metre/s from Ball"))
+
+    # Save the figure
+    canvas.save(filename, artists)
+
+
+def five_v_five_frame(filename, frame, frame_data, pitch_length, pitch_width, mean_distance):
+    """
+    Team Closeness figure of one frame: each home player joined to the closest opponent.
+    :param frame_data: rows of the closeness table for the frame
+    :param mean_distance: mean distance between the paired players in the frame
+    """
+    # Initialise the pitch
+    canvas = pitch_canvas("frame", (10, 7), 1, DPI, pitch_type="custom", pitch_color="#22312b", line_color="white",
+                          pitch_length=pitch_length, pitch_width=pitch_width)
+    pitch = canvas.pitch
+    ax = canvas.axes[0]
+
+    if frame_data["poss"].iloc[0] == "H":
+        possession_status = "Home Possession"
+    else:
+        possession_status = "Away Possession"
+
+    # Plot players and draw lines between home players and their closest opponents
+    artists = []
+    for _, row in frame_data.iterrows():
+        # Home player
+        artists.append(pitch.scatter(row["x_home_player"], row["y_home_player"], ax=ax, s=120, color="red",
+                                     edgecolors="black", zorder=2))
+        home_p = row["home_squadNum"]
+        artists.append(ax.text(row["x_home_player"] + 1, row["y_home_player"] + 1, home_p, color="white", fontsize=6,
+                               ha="center", va="center", zorder=3,
+                               bbox=dict(facecolor="red", alpha=0.25, edgecolor="black")))
+
+        # Away player
+        artists.append(pitch.scatter(row["x_away_player"], row["y_away_player"], ax=ax, s=120, color="blue",
+                                     edgecolors="black", zorder=2))
+        away_p = row["away_squadNum"]
+        artists.append(ax.text(row["x_away_player"] + 1, row["y_away_player"] + 1, away_p, color="white", fontsize=6,
+                               ha="center", va="center", zorder=3,
+                               bbox=dict(facecolor="blue", alpha=0.25, edgecolor="black")))
+
+        # Line between home player and opponent indicating closeness
+        artists.append(pitch.lines(row["x_home_player"], row["y_home_player"], row["x_away_player"],
+                                   row["y_away_player"], lw=1, color="yellow", ax=ax, zorder=1))
+
+    # Plot the ball's position
+    ball_x = frame_data["x_ball"].iloc[-1]
+    ball_y = frame_data["y_ball"].iloc[-1]
+    artists.append(pitch.scatter(ball_x, ball_y, ax=ax, s=120, color="white", edgecolors="black", zorder=2,
+                                 label="Ball"))
+
+    artists.append(ax.set_title(f"Frame: {frame} - {possession_status}", color="black"))
+
+    info_text = f"Mean Distance: {mean_distance:.2f}"
+    artists.append(canvas.figure.text(0.5, 0.01, info_text, ha="center", fontsize=10, color="black"))
+
+    artists.append(ax.legend(loc="upper right"))
+
+    # Save the heatmap for the current frame
+    canvas.save(filename, artists)
+
+
+def blocking_pass_frame(filename, frame, frame_data, pitch_length, pitch_width, frame_intersection_info):
+    """
+    Blocking Passes figure of one frame: the players, with lines from the ball to the team in possession.
+    :param frame_data: rows of player_and_ball for the frame
+    :param frame_intersection_info: list of dictionaries of the players blocking a pass in the frame
+    """
+    # Initialising the pitch
+    canvas = pitch_canvas("frame", (10, 7), 1, DPI, pitch_type="custom", pitch_color="#22312b", line_color="white",
+                          pitch_length=pitch_length, pitch_width=pitch_width)
+    pitch = canvas.pitch
+    ax = canvas.axes[0]
+
+    if frame_data["poss"].iloc[0] == "H":
+        possession_status = "Home Possession"
+        possessing_team_id = 1
+    else:
+        possession_status = "Away Possession"
+        possessing_team_id = 0
+
+    ball_x = frame_data["x_ball"].iloc[0]
+    ball_y = frame_data["y_ball"].iloc[0]
+
+    # Iterate through the frame data to plot each player and the ball
+    artists = []
+    for _, row in frame_data.iterrows():
+        team_colour = "blue" if row["team_id"] == 0 else "red"
+        player_label = f"{row['squadNum']}"  # label with squad number
+
+        # Plot player
+        artists.append(pitch.scatter(row["x_player"], row["y_player"], ax=ax, s=120, color=team_colour,
+                                     edgecolors="black", zorder=2))
+        artists.append(ax.text(row["x_player"] + 1, row["y_player"] + 1, player_label, color="white", fontsize=6,
+                               ha="center", va="center", zorder=3,
+                               bbox=dict(facecolor=team_colour, alpha=0.25, edgecolor=team_colour)))
+
+        # Draw line to ball for players on the possessing team
+        if row["team_id"] == possessing_team_id:
+            artists.append(pitch.lines(ball_x, ball_y, row["x_player"], row["y_player"], lw=0.6,
+                                       color="yellow", ax=ax, zorder=1))
+
+    info_text = "".join(
+        f"Team ID: {player['team_id']}, Player ID: {player['player_id']}, Squad Number: {player['squad_num']}\n"
+        for player in frame_intersection_info)
+    artists.append(canvas.figure.text(0.5, 0.01, info_text, ha="center", fontsize=10, color="black"))
+
+    artists.append(pitch.scatter(ball_x, ball_y, ax=ax, s=120, color="white", edgecolors="black", zorder=2,
+                                 label="Ball"))
+
+    artists.append(ax.set_title(f"Frame: {frame} - {possession_status}", color="Black"))
+    artists.append(ax.legend(loc="upper right"))
+
+    # Save the heatmap for the current frame
+    canvas.save(filename, artists)
+
+
+def write_clip(filename, images, fps):
+    """
+    Encodes the frames of a clip by the extension of the filename: .gif with Pillow, .mp4 with ffmpeg, or .png for a
+    strip of the frames side by side.
+    :param images: list of (height, width, 4) arrays
+    :param fps: frames shown per second
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".png":
+        imsave(filename, np.concatenate(images, axis=1))
+    elif extension == ".gif":
+        frames = [Image.fromarray(image).convert("RGB") for image in images]
+        frames[0].save(filename, save_all=True, append_images=frames[1:], duration=round(1000 / fps), loop=0)
+    elif extension == ".mp4":
+        ffmpeg = shutil.which(plt.rcParams["animation.ffmpeg_path"])
+        if ffmpeg is None:
+            raise ValueError("Writing .mp4 clips needs ffmpeg, write .gif or .png clips instead")
+        height, width = images[0].shape[:2]
+        # raw frames piped in, padded to even dimensions for the H.264 encoder
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                        "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+                        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-vcodec", "libx264", "-pix_fmt", "yuv420p",
+                        filename], input=b"".join(image.tobytes() for image in images), check=True)
+    else:
+        raise ValueError(f"Unknown clip format {extension!r}, expected .gif, .mp4 or .png")
+
+
+def label_texts(ax, count, colour, edge_colour):
+    """
+    Squad number labels for the players of a clip, hidden until a frame uses them.
+    """
+    return [ax.text(0, 0, "", color="white", fontsize=6, ha="center", va="center", zorder=3, visible=False,
+                    bbox=dict(facecolor=colour, alpha=0.25, edgecolor=edge_colour)) for _ in range(count)]
+
+
+def move_labels(labels, positions, texts, colours=None):
+    """
+    Puts a label next to each player of a frame and hides the labels left over.
+    :param positions: (players, 2) array of the players' positions
+    :param texts: text of each label
+    :param colours: colour of each label's box, if they change from player to player
+    """
+    for k, label in enumerate(labels):
+        label.set_visible(k < len(positions))
+        if k < len(positions):
+            label.set_position((positions[k, 0] + 1, positions[k, 1] + 1))
+            label.set_text(str(texts[k]))
+            if colours is not None:
+                label.get_bbox_patch().set_facecolor(colours[k])
+                label.get_bbox_patch().set_edgecolor(colours[k])
+
+
+def possession_status(frame_data):
+    return "Home Possession" if frame_data["poss"].iloc[0] == "H" else "Away Possession"
+
+
+def five_v_five_clip(filename, frames, pitch_length, pitch_width, fps):
+    """
+    Team Closeness clip of the lead-up to a turnover, the frames of five_v_five_frame one after another.
+    :param frames: list of (frame, rows of the closeness table for the frame, mean distance of the frame)
+    :param fps: frames shown per second
+    """
+    canvas = pitch_canvas("clip", (10, 7), 1, CLIP_DPI, pitch_type="custom", pitch_color="#22312b",
+                          line_color="white", pitch_length=pitch_length, pitch_width=pitch_width)
+    ax = canvas.axes[0]
+    players = max(len(frame_data) for _, frame_data, _ in frames)
+
+    # the artists of the clip, created once and moved from frame to frame
+    lines = LineCollection([], colors="yellow", linewidths=1, zorder=1)
+    ax.add_collection(lines)
+    home = ax.scatter([], [], s=120, color="red", edgecolors="black", zorder=2)
+    away = ax.scatter([], [], s=120, color="blue", edgecolors="black", zorder=2)
+    ball = ax.scatter([], [], s=120, color="white", edgecolors="black", zorder=2, label="Ball")
+    home_labels = label_texts(ax, players, "red", "black")
+    away_labels = label_texts(ax, players, "blue", "black")
+    title = ax.set_title("", color="black")
+    info = canvas.figure.text(0.5, 0.01, "", ha="center", fontsize=10, color="black")
+    legend = ax.legend(loc="upper right")
+    artists = [lines, home, away, ball, *home_labels, *away_labels, title, info, legend]
+
+    images = []
+    for frame, frame_data, mean_distance in frames:
+        home_positions = frame_data[["x_home_player", "y_home_player"]].to_numpy(dtype=float)
+        away_positions = frame_data[["x_away_player", "y_away_player"]].to_numpy(dtype=float)
+
+        # each home player joined to the closest opponent
+        home.set_offsets(home_positions)
+        away.set_offsets(away_positions)
+        lines.set_segments(np.stack([home_positions, away_positions], axis=1))
+        move_labels(home_labels, home_positions, frame_data["home_squadNum"].tolist())
+        move_labels(away_labels, away_positions, frame_data["away_squadNum"].tolist())
+        ball.set_offsets([[frame_data["x_ball"].iloc[-1], frame_data["y_ball"].iloc[-1]]])
+
+        title.set_text(f"Frame: {frame} - {possession_status(frame_data)}")
+        info.set_text(f"Mean Distance: {mean_distance:.2f}")
+        images.append(canvas.draw(artists).copy())
+
+    canvas.clear(artists)
+    write_clip(filename, images, fps)
+
+
+def blocking_pass_clip(filename, frames, pitch_length, pitch_width, fps):
+    """
+    Blocking Passes clip of the lead-up to a turnover, the frames of blocking_pass_frame one after another.
+    :param frames: list of (frame, rows of player_and_ball for the frame, list of dictionaries of the players blocking
+    a pass in the frame)
+    :param fps: frames shown per second
+    """
+    canvas = pitch_canvas("clip", (10, 7), 1, CLIP_DPI, pitch_type="custom", pitch_color="#22312b",
+                          line_color="white", pitch_length=pitch_length, pitch_width=pitch_width)
+    ax = canvas.axes[0]
+    players = max(len(frame_data) for _, frame_data, _ in frames)
+
+    # the artists of the clip, created once and moved from frame to frame
+    lines = LineCollection([], colors="yellow", linewidths=0.6, zorder=1)
+    ax.add_collection(lines)
+    player_points = ax.scatter([], [], s=120, edgecolors="black", zorder=2)
+    ball = ax.scatter([], [], s=120, color="white", edgecolors="black", zorder=2, label="Ball")
+    labels = label_texts(ax, players, "blue", "blue")
+    title = ax.set_title("", color="Black")
+    info = canvas.figure.text(0.5, 0.01, "", ha="center", fontsize=10, color="black")
+    legend = ax.legend(loc="upper right")
+    artists = [lines, player_points, ball, *labels, title, info, legend]
+
+    images = []
+    for frame, frame_data, frame_intersection_info in frames:
+        possessing_team_id = 1 if frame_data["poss"].iloc[0] == "H" else 0
+        positions = frame_data[["x_player", "y_player"]].to_numpy(dtype=float)
+        colours = np.where(frame_data["team_id"].to_numpy() == 0, "blue", "red").tolist()
+        ball_position = np.array([frame_data["x_ball"].iloc[0], frame_data["y_ball"].iloc[0]], dtype=float)
+
+        # lines from the ball to the players of the team in possession
+        in_possession = positions[frame_data["team_id"].to_numpy() == possessing_team_id]
+        lines.set_segments(np.stack([np.broadcast_to(ball_position, in_possession.shape), in_possession], axis=1))
+        player_points.set_offsets(positions)
+        player_points.set_facecolor(colours)
+        move_labels(labels, positions, frame_data["squadNum"].tolist(), colours)
+        ball.set_offsets([ball_position])
+
+        title.set_text(f"Frame: {frame} - {possession_status(frame_data)}")
+        info.set_text("".join(
+            f"Team ID: {player['team_id']}, Player ID: {player['player_id']}, Squad Number: {player['squad_num']}\n"
+            for player in frame_intersection_info))
+        images.append(canvas.draw(artists).copy())
+
+    canvas.clear(artists)
+    write_clip(filename, images, fps)
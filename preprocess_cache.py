@@ -0,0 +1,158 @@
+# Skips preprocessing stages whose inputs have not changed. Each stage records a hash of the contents of its input
+# files and of its parameters in a manifest, and is only run again when that hash changes or its outputs are gone.
+import hashlib
+import json
+import os
+import time
+
+import chunked
+import match_events
+import player_and_ball
+import preprocess_data
+import turnovers
+
+MANIFEST_FILE = 'data/preprocess_manifest.json'
+
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as file:
+            return json.load(file)
+    return {'files': {}, 'stages': {}}
+
+
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    os.makedirs(os.path.dirname(manifest_file) or '.', exist_ok=True)
+    with open(manifest_file, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_hash(filename, manifest):
+    """
+    Hashes the contents of a file. The hash is remembered in the manifest with the size and modification time of
+    the file, so a large .dat file is only read again when it has changed.
+    :param filename: file to hash
+    :param manifest: manifest loaded with load_manifest
+    :return: hex digest
+    """
+    signature = file_signature(filename)
+    known = manifest['files'].get(filename)
+    if known and known['signature'] == signature:
+        return known['hash']
+
+    digest = hashlib.blake2b()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+
+    manifest['files'][filename] = {'signature': signature, 'hash': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def stage_key(inputs, params, manifest):
+    """
+    :return: hash of the contents of the input files and of the parameters of a stage
+    """
+    digest = hashlib.blake2b()
+    for filename in inputs:
+        digest.update(filename.encode())
+        digest.update(file_hash(filename, manifest).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def run_stage(name, inputs, params, outputs, function, manifest_file=MANIFEST_FILE):
+    """
+    Runs a preprocessing stage, unless it has already been run with the same inputs and parameters and its outputs
+    are untouched since.
+    :param name: name of the stage in the manifest
+    :param inputs: files the stage reads
+    :param params: parameters of the stage, anything JSON can store
+    :param outputs: files the stage writes
+    :param function: runs the stage, taking no arguments. Its return value must be something JSON can store.
+    :param manifest_file: where the manifest is kept
+    :return: the return value of the function, from the manifest when the stage is skipped
+    """
+    manifest = load_manifest(manifest_file)
+    key = stage_key(inputs, params, manifest)
+
+    recorded = manifest['stages'].get(name)
+    if recorded and recorded['key'] == key and all(
+            os.path.exists(output) and file_signature(output) == recorded['outputs'].get(output)
+            for output in outputs):
+        print(f"Skipping {name}: inputs unchanged")
+        return recorded['result']
+
+    start = time.perf_counter()
+    result = function()
+    manifest['stages'][name] = {'key': key, 'params': params, 'inputs': list(inputs),
+                                'outputs': {output: file_signature(output) for output in outputs},
+                                'result': result, 'seconds_taken': round(time.perf_counter() - start, 3)}
+    save_manifest(manifest, manifest_file)
+
+    return result
+
+
+def preprocess(datafile, metadata_file=preprocess_data.METADATA_FILE, seconds=1, strategy='every_n', store=False,
+               workers=None, staged=False, memory_budget=None, manifest_file=MANIFEST_FILE):
+    """
+    Preprocesses a match into data/player.csv, data/ball.csv, their turnovers data/turnovers.csv, the match event
+    intervals data/events.csv and the join data/player_and_ball.csv, skipping whatever is already up to date.
+    :param datafile: .dat file of the match
+    :param metadata_file: the metadata file given with the game data
+    :param seconds: Real seconds per data capture.
+    :param strategy: how each x seconds are reduced to one line, see preprocess_data.downsample
+    :param store: also write the tables to the columnar match store
+    :param workers: number of worker processes for the single pass ingestion
+    :param staged: run half trimming, downsampling and categorisation as separate stages with intermediate .dat
+    files, so that e.g. changing the interval does not trim the halves again
+    :param memory_budget: bytes of memory for the merging stage, which then joins the tables a block of frames at a
+    time (see chunked.join_player_and_ball) and writes only data/player_and_ball.csv
+    :param manifest_file: where the manifest is kept
+    """
+    metadata = preprocess_data.get_metadata(metadata_file)
+    outputs = ['data/player.csv', 'data/ball.csv']
+    if store:
+        outputs += [os.path.join(preprocess_data.match_store.table_path(name), 'meta.json')
+                    for name in ('player', 'ball')]
+
+    # the match events are gathered by the stage reading the .dat file, not read from it again
+    if not staged:
+        run_stage('ingest', [datafile, metadata_file], {'seconds': seconds, 'strategy': strategy, 'store': store},
+                  outputs + [match_events.EVENTS_FILE],
+                  lambda: preprocess_data.parallel_data(metadata.first_half, metadata.second_half, datafile, seconds,
+                                                        metadata=metadata, store=store, workers=workers,
+                                                        strategy=strategy, events_file=match_events.EVENTS_FILE),
+                  manifest_file)
+    else:
+        in_play = run_stage('half_trimming', [datafile, metadata_file], {},
+                            ['data/gamedata/in_play.dat', match_events.EVENTS_FILE],
+                            lambda: preprocess_data.eliminate_noise(metadata.first_half, metadata.second_half,
+                                                                    datafile, events_file=match_events.EVENTS_FILE),
+                            manifest_file)
+        short_data = run_stage('downsampling', [in_play, metadata_file], {'seconds': seconds, 'strategy': strategy},
+                               ['data/gamedata/short_data.dat'],
+                               lambda: preprocess_data.shorten_data(seconds, in_play, strategy, metadata.frame_rate),
+                               manifest_file)
+        run_stage('categorisation', [short_data, metadata_file], {'store': store}, outputs,
+                  lambda: preprocess_data.categorize_data(short_data, metadata, store), manifest_file)
+
+    run_stage('turnovers', ['data/ball.csv'], {}, [turnovers.TURNOVER_FILE], turnovers.write_turnover_index,
+              manifest_file)
+
+    if memory_budget is not None:
+        run_stage('merging', ['data/player.csv', 'data/ball.csv'], {'memory_budget': memory_budget},
+                  ['data/player_and_ball.csv'],
+                  lambda: chunked.join_player_and_ball(memory_budget=memory_budget), manifest_file)
+        return
+
+    merged_outputs = ['data/player_and_ball.csv', player_and_ball.TENSOR_FILE]
+    if store:
+        merged_outputs.append(os.path.join(preprocess_data.match_store.table_path('player_and_ball'), 'meta.json'))
+    run_stage('merging', ['data/player.csv', 'data/ball.csv'], {'store': store}, merged_outputs,
+              lambda: player_and_ball.join_player_and_ball(store=store), manifest_file)
@@ -1,9 +1,28 @@
 # This file should prepare the data by splitting it into first and second halfs, removing noise, and shortening it
 # down to a manageable size for efficiency.
+import io
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from xml.dom import minidom as mdom
+import numpy as np
 import pandas as pd
 
+import match_store
+from fileio import compression_of, open_file
+
+
+PLAYER_COLUMNS = ['frame_num', 'team_id', 'player_id', 'squadNum', 'x', 'y', 'speed']
+BALL_COLUMNS = ['frame_num', 'x', 'y', 'z', 'speed', 'poss', 'inPlay']
+
+METADATA_FILE = 'data/metadata/metadata.xml'
+
+# number of lines parsed and scaled together by categorize_lines
+BLOCK_LINES = 10000
+# columns of whole numbers in the .dat file, parsed as integers by categorize_lines
+INTEGER_COLUMNS = ('frame_num', 'team_id', 'player_id', 'squadNum', 'x', 'y')
+
 
 def frame_to_time(frame_num, frame_rate, start_frame):
     adjusted_frame_num = frame_num - start_frame
@@ -45,138 +64,757 @@ def split_halves(metadata_filename):
     return [pitch, tracking_size, first_half, second_half]
 
 
-pitch, tracking_size, first_half, second_half = split_halves('data/metadata/metadata.xml')
+def get_frame_rate(metadata_filename):
+    """
+    Reads the frame rate of the tracking data from the metadata file, defaulting to 25 fps.
+    :param metadata_filename: the metadata file given with the game data
+    :return: frames per second
+    """
+    match = mdom.parse(metadata_filename).getElementsByTagName('match')[0]
+    if match.hasAttribute('iFrameRateFps'):
+        return int(get_attr_value(match, 'iFrameRateFps'))
+    return 25
+
 
+class MatchMetadata:
+    """
+    Details of a match needed by the preprocessing and the analyses: pitch size, tracking area size,
+    the first and last frames of each half, and the frame rate.
+    """
 
-def eliminate_noise(half1, half2, datafile):
+    def __init__(self, pitch, tracking_size, first_half, second_half, frame_rate=25):
+        self.pitch = pitch
+        self.tracking_size = tracking_size
+        self.first_half = first_half
+        self.second_half = second_half
+        self.frame_rate = frame_rate
+
+        # calculating amount to cut off tracking boundaries
+        self.excess_x = ((tracking_size['x'] - pitch['x']) / 2) * 100
+        self.excess_y = ((tracking_size['y'] - pitch['y']) / 2) * 100
+
+        self.max_x = (tracking_size['x'] * 50) - self.excess_x
+        self.max_y = (tracking_size['y'] * 50) - self.excess_y
+
+    @classmethod
+    def from_xml(cls, metadata_filename):
+        """
+        Parses the metadata XML file.
+        :param metadata_filename: the metadata file given with the game data
+        :return: MatchMetadata
+        """
+        pitch, tracking_size, first_half, second_half = split_halves(metadata_filename)
+        return cls(pitch, tracking_size, first_half, second_half, get_frame_rate(metadata_filename))
+
+    @classmethod
+    def load(cls, metadata_filename=METADATA_FILE):
+        """
+        Loads the metadata from a small JSON sidecar next to the XML file, only parsing the XML
+        (and rewriting the sidecar) when the sidecar is missing or older than the XML.
+        :param metadata_filename: the metadata file given with the game data
+        :return: MatchMetadata
+        """
+        sidecar = os.path.splitext(metadata_filename)[0] + '.json'
+
+        if os.path.exists(sidecar) and (not os.path.exists(metadata_filename) or
+                                        os.path.getmtime(sidecar) >= os.path.getmtime(metadata_filename)):
+            with open(sidecar, 'r') as file:
+                return cls(**json.load(file))
+
+        metadata = cls.from_xml(metadata_filename)
+        with open(sidecar, 'w') as file:
+            json.dump(metadata.to_dict(), file, indent=2)
+        return metadata
+
+    def to_dict(self):
+        return {'pitch': self.pitch, 'tracking_size': self.tracking_size, 'first_half': self.first_half,
+                'second_half': self.second_half, 'frame_rate': self.frame_rate}
+
+
+_loaded_metadata = {}
+
+
+def get_metadata(metadata_filename=METADATA_FILE):
     """
-    Producing a new DAT file containing active play (i.e. first and second halves).
+    Returns the metadata of a match, loading it on first use only.
+    :param metadata_filename: the metadata file given with the game data
+    :return: MatchMetadata
+    """
+    if metadata_filename not in _loaded_metadata:
+        _loaded_metadata[metadata_filename] = MatchMetadata.load(metadata_filename)
+    return _loaded_metadata[metadata_filename]
+
+
+def __getattr__(name):
+    # keeps "from preprocess_data import pitch" working without reading the metadata at import time
+    if name in ('pitch', 'tracking_size', 'first_half', 'second_half', 'frame_rate',
+                'excess_x', 'excess_y', 'max_x', 'max_y'):
+        return getattr(get_metadata(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def read_in_play(half1, half2, datafile):
+    """
+    Streams the lines of a DAT file that belong to active play (i.e. first and second halves).
     :param half1: Extracted metadata about the first half.
     :param half2: Extracted metadata about the second half.
-    :param datafile: .dat file to be cleaned.
-    :return: Name of the new file produced.
+    :param datafile: .dat file to be read, optionally compressed (e.g. .dat.gz).
+    :return: Generator of the lines in play.
     """
     half1_start = half1['start']
     half1_end = half1['end']
     half2_start = half2['start']
     half2_end = half2['end']
 
-    with open(datafile, "r") as input_file:
-        with open("data/gamedata/in_play.dat", "w") as output_file:
-            start_processing = False
-            for line in input_file:
-                # Getting the frame number. Casting it to an integer.
-                frame = int(line.strip().split(":")[0])
+    with open_file(datafile, "r") as input_file:
+        start_processing = False
+        for line in input_file:
+            # Getting the frame number. Casting it to an integer.
+            frame = int(line.split(":", 1)[0])
+
+            if not start_processing:
+                # Checking if the target column has the target value.
+                if frame == half1_start or \
+                        frame == half2_start:
+                    start_processing = True
+                    yield line
+            # Checking if the frame is an end frame. If it is, then stop processing.
+            elif frame == half1_end or \
+                    frame == half2_end:
+                start_processing = False
+            else:
+                yield line
+
+
+def eliminate_noise(half1, half2, datafile, output_filename="data/gamedata/in_play.dat", events_file=None):
+    """
+    Producing a new DAT file containing active play (i.e. first and second halves).
+    :param half1: Extracted metadata about the first half.
+    :param half2: Extracted metadata about the second half.
+    :param datafile: .dat file to be cleaned, optionally compressed (e.g. .dat.gz).
+    :param output_filename: Name of the new file, compressed when it ends in e.g. .gz
+    :param events_file: also write the match events of the lines in play here, see match_events.StateRuns
+    :return: Name of the new file produced.
+    """
+    lines, state_runs = watch_states(read_in_play(half1, half2, datafile), events_file)
+    with open_file(output_filename, "w") as output_file:
+        output_file.writelines(lines)
+    if state_runs:
+        state_runs.write(events_file)
+
+    return output_filename
+
+
+def split_line(line):
+    """
+    Splits a line of tracking data into its frame number, player records and ball fields, all left as text.
+    """
+    frame_num, players, ball = line.split(':')[:3]
+    return frame_num, [j.split(',') for j in players.split(';') if j], ball.split(',')
+
+
+def join_line(frame_num, players, ball):
+    """
+    Puts a line of tracking data back together from the parts given by split_line.
+    """
+    return f"{frame_num}:{';'.join(','.join(player) for player in players)};:{','.join(ball)}:\n"
+
+
+def keep_first(window):
+    """
+    Downsampling strategy keeping the first frame of each window.
+    """
+    return window[0]
+
+
+def mean_of_window(window):
+    """
+    Downsampling strategy averaging the positions and speeds of each player and of the ball over the window.
+    The frame number, possession and in play status are those of the first frame.
+    """
+    frame_num, _, first_ball = split_line(window[0])
+
+    records = {}
+    balls = []
+    for line in window:
+        _, players, ball = split_line(line)
+        for player in players:
+            records.setdefault((player[0], player[1]), []).append(player)
+        balls.append(ball)
+
+    def mean(values, speed=False):
+        average = sum(float(value) for value in values) / len(values)
+        return f"{average:.2f}" if speed else str(round(average))
 
-                if not start_processing:
-                    # Checking if the target column has the target value.
-                    if frame == half1_start or \
-                            frame == half2_start:
-                        start_processing = True
-                        output_file.write(line)
-                # Checking if the frame is an end frame. If it is, then stop processing.
-                elif frame == half1_end or \
-                        frame == half2_end:
-                    start_processing = False
-                else:
-                    # Writing the line to the new file.
-                    output_file.write(line)
+    players = [[samples[0][0], samples[0][1], samples[0][2], mean([p[3] for p in samples]),
+                mean([p[4] for p in samples]), mean([p[5] for p in samples], speed=True)]
+               for samples in records.values()]
+    ball = [mean([b[0] for b in balls]), mean([b[1] for b in balls]), mean([b[2] for b in balls]),
+            mean([b[3] for b in balls], speed=True)] + first_ball[4:]
 
-    return output_file.name
+    return join_line(frame_num, players, ball)
 
 
-def shorten_data(seconds, filename):
+def max_speed_of_window(window):
+    """
+    Downsampling strategy keeping, for each player and for the ball, the sample with the highest speed in the window.
+    The frame number, possession and in play status are those of the first frame.
+    """
+    frame_num, _, first_ball = split_line(window[0])
+
+    fastest = {}
+    fastest_ball = None
+    for line in window:
+        _, players, ball = split_line(line)
+        for player in players:
+            key = (player[0], player[1])
+            if key not in fastest or float(player[5]) > float(fastest[key][5]):
+                fastest[key] = player
+        if fastest_ball is None or float(ball[3]) > float(fastest_ball[3]):
+            fastest_ball = ball
+
+    return join_line(frame_num, list(fastest.values()), fastest_ball[:4] + first_ball[4:])
+
+
+DOWNSAMPLING_STRATEGIES = {
+    'every_n': keep_first,
+    'mean': mean_of_window,
+    'max_speed': max_speed_of_window,
+}
+
+
+def frames_per_sample(seconds, frame_rate=25):
+    """
+    :param seconds: Real seconds per data capture, may be less than a second.
+    :param frame_rate: frames per second of the tracking data
+    :return: number of frames that make up one data capture
+    """
+    return max(1, round(seconds * frame_rate))
+
+
+def line_frame(line):
+    return int(line.split(':', 1)[0])
+
+
+def frame_windows(lines, size, first=None):
+    """
+    Splits a stream of lines into windows of up to size lines of consecutive frames. A window is cut short at a gap
+    in the frames, such as half time, and the next one starts after it, so no window holds frames of both halves.
+    :param lines: Iterable of data lines, in frame order.
+    :param size: lines per window
+    :param first: lines of the first window, if it is to be shorter, see categorize_range
+    :return: Generator of lists of lines.
+    """
+    window = []
+    limit = first or size
+    previous = None
+    for line in lines:
+        frame = line_frame(line)
+        if window and (len(window) == limit or frame != previous + 1):
+            yield window
+            window = []
+            limit = size
+        window.append(line)
+        previous = frame
+    if window:
+        yield window
+
+
+def downsample(lines, seconds, strategy='every_n', frame_rate=25):
+    """
+    Reduces a stream of lines to one line every x seconds. The lines are taken in windows of x seconds, restarting
+    at every gap in the frames (see frame_windows), and each window is reduced to one line by the strategy, one of
+    DOWNSAMPLING_STRATEGIES.
+    :param lines: Iterable of data lines.
+    :param seconds: Real seconds per data capture.
+    :param strategy: 'every_n' keeps the first frame of each window, 'mean' averages positions and speeds over the
+    window and 'max_speed' keeps the fastest sample of each player in the window.
+    :param frame_rate: frames per second of the tracking data
+    :return: Generator of the lines kept.
+    """
+    reduce_window = DOWNSAMPLING_STRATEGIES[strategy]
+    for window in frame_windows(lines, frames_per_sample(seconds, frame_rate)):
+        yield reduce_window(window)
+
+
+def shorten_data(seconds, filename, strategy='every_n', frame_rate=None):
     """
     Producing a new data file contains only every x seconds the user specifies.
     :param seconds: Real seconds per data capture.
-    :param filename: Name of the file to be shortened down.
+    :param filename: Name of the file to be shortened down, optionally compressed.
+    :param strategy: how each x seconds are reduced to one line, see downsample
+    :param frame_rate: frames per second of the tracking data, defaults to that of the loaded match
     :return: Name of the new file produced.
     """
-    n = seconds * 25  # 25 frames per second.
-    with open(filename, "r") as file:
+    frame_rate = frame_rate or get_metadata().frame_rate
+    with open_file(filename, "r") as file:
         with open("data/gamedata/short_data.dat", "w") as newfile:
-            for i, line in enumerate(file):
-                if i % n == 0:
-                    newfile.write(line)
+            newfile.writelines(downsample(file, seconds, strategy, frame_rate))
 
     return newfile.name
 
 
-# calculating amount to cut off tracking boundaries
-excess_x = ((tracking_size['x'] - pitch['x']) / 2) * 100
-excess_y = ((tracking_size['y'] - pitch['y']) / 2) * 100
-
-max_x = (tracking_size['x'] * 50) - excess_x
-max_y = (tracking_size['y'] * 50) - excess_y
-
-
-def scale_data_to_pitch(orig_x, orig_y):
+def scale_data_to_pitch(orig_x, orig_y, metadata=None):
     """
     Calculating the pitch borders in tracking terms.
     :param orig_x: Original X
     :param orig_y: Original Y
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
     :return x, y: pitch borders
     """
+    metadata = metadata or get_metadata()
 
-    x = (int(orig_x) + max_x) / 100
-    y = (int(orig_y) + max_y) / 100
+    x = (int(orig_x) + metadata.max_x) / 100
+    y = (int(orig_y) + metadata.max_y) / 100
     return x, y
 
 
-def categorize_data(filename):
+def categorize_line(line, metadata=None):
     """
-    splits the data into two CSV files: players and ball
-    :param filename: the name of the file to categorise
-    :return: void
+    Parses one line of tracking data into player and ball rows, scaled to the pitch.
+    Anything outside the borders of the pitch is dropped.
+    :param line: a line of the .dat file
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :return: list of player rows, and the ball row (None if the ball is off the pitch)
     """
+    metadata = metadata or get_metadata()
+    pitch = metadata.pitch
+    # create frame num, list of players, and ball details
+    frame_num, players, ball = line.split(':')[:3]
+    ball = ball.split(',')
+
+    # add frame details to ball data
+    ball[0], ball[1] = scale_data_to_pitch(ball[0], ball[1], metadata)
+
+    ball_frame = None
+    if (0 < int(ball[0]) < pitch['x']) and (0 < int(ball[1]) < pitch['y']):
+        ball_frame = [frame_num, ball[0], ball[1], ball[2], ball[3], ball[4], ball[5].strip(';')]
+
+    # add frame details to each player
+    player_frames = []
+    for j in players.split(';'):
+        data = j.split(',')
+
+        # getting rid of any data outside borders of the pitch
+        # converting tracking data to meters
+        if len(data) > 1:
+            # convert x and y to positive values and reduce scale to metres
+            data[3], data[4] = scale_data_to_pitch(data[3], data[4], metadata)
+
+            if (0 < int(data[3]) < pitch['x']) and (0 < int(data[4]) < pitch['y']):
+                # remove any frames that are outside the pitch borders
+                player_frames.append([frame_num, data[0], data[1], data[2], data[3], data[4], data[5]])
+
+    return player_frames, ball_frame
+
+
+def scale_columns_to_pitch(orig_x, orig_y, metadata=None):
+    """
+    Vectorised scale_data_to_pitch. Converts whole columns of tracking coordinates to metres on the pitch
+    and works out which of them are within the borders of the pitch.
+    :param orig_x: Original X column, as integers
+    :param orig_y: Original Y column
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :return x, y, in_pitch: scaled columns, and a mask of the positions inside the pitch
+    """
+    metadata = metadata or get_metadata()
+
+    x = (np.asarray(orig_x, dtype=np.int64) + metadata.max_x) / 100
+    y = (np.asarray(orig_y, dtype=np.int64) + metadata.max_y) / 100
+
+    # truncating like int() does in categorize_line
+    whole_x = np.trunc(x)
+    whole_y = np.trunc(y)
+    in_pitch = (0 < whole_x) & (whole_x < metadata.pitch['x']) & (0 < whole_y) & (whole_y < metadata.pitch['y'])
+    return x, y, in_pitch
+
+
+def read_fields(text, columns, **options):
+    """
+    Parses lines of comma separated fields with pandas' C parser. Whole number columns are parsed as integers, which
+    are written out as the same text; the others are kept as the text they were in the .dat file, so e.g. a speed of
+    "0.90" is written out unchanged.
+    :param text: list of lines, without line endings
+    :param columns: names of the fields
+    :param options: passed on to pd.read_csv
+    :return: DataFrame
+    """
+    dtypes = {column: np.int64 if column in INTEGER_COLUMNS else object for column in columns}
+    if not text:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+    return pd.read_csv(io.StringIO('\n'.join(text)), header=None, names=columns, dtype=dtypes, na_filter=False,
+                       **options)
 
-    player_data = []
-    ball_data = []
 
-    with open(filename, 'r') as file:
-        for i in file:
-            # create frame num, list of players, and ball details
-            frame_num = i.split(':')[0]
-            players = i.split(':')[1].split(';')
-            ball = i.split(':')[2].split(',')
+def on_pitch(rows, metadata=None):
+    """
+    Scales the x and y columns of a block of rows to the pitch, dropping the rows outside the borders of the pitch.
+    """
+    x, y, in_pitch = scale_columns_to_pitch(rows['x'].to_numpy(), rows['y'].to_numpy(), metadata)
+    rows['x'] = x
+    rows['y'] = y
+    return rows[in_pitch].reset_index(drop=True)
+
+
+def categorize_lines(lines, metadata=None):
+    """
+    Block version of categorize_line. The player records and ball fields of all the lines are gathered into two
+    blocks of CSV text and parsed in one go, then the coordinates of the whole block are scaled and checked against
+    the pitch at once.
+    :param lines: lines of the .dat file
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :return: DataFrame of player rows, DataFrame of ball rows, with the columns of PLAYER_COLUMNS and BALL_COLUMNS
+    """
+    frame_nums = []
+    player_counts = []
+    player_text = []
+    ball_text = []
 
-            # add frame details to ball data and add to list
-            ball[0], ball[1] = scale_data_to_pitch(ball[0], ball[1])
+    for line in lines:
+        frame_num, players, ball = line.split(':', 3)[:3]
+        frame_nums.append(frame_num)
+        ball_text.append(ball)
 
-            if (0 < int(ball[0]) < pitch['x']) and (0 < int(ball[1]) < pitch['y']):
-                ball_frame = [frame_num, ball[0], ball[1], ball[2], ball[3], ball[4], ball[5].strip(';')]
-                ball_data.append(ball_frame)
+        # one player record per line, the frame number is put in front of them once they are parsed
+        players = players.strip(';')
+        player_counts.append(players.count(';') + 1 if players else 0)
+        if players:
+            player_text.append(players.replace(';', '\n'))
 
-            # add frame details to each player and add them to list
-            for j in players:
-                data = j.split(',')
+    frame_nums = np.array(frame_nums, dtype=np.int64)
 
-                # getting rid of any data outside borders of the pitch
-                # converting tracking data to meters
-                if len(data) > 1:
-                    # convert x and y to positive values and reduce scale to metres
-                    data[3], data[4] = scale_data_to_pitch(data[3], data[4])
+    player_rows = read_fields(player_text, PLAYER_COLUMNS[1:])
+    player_rows.insert(0, 'frame_num', np.repeat(frame_nums, player_counts))
+
+    # "x,y,z,speed,poss,inPlay[,restart];", everything from the ';' on is skipped and the restart is not kept.
+    # Lines without a restart leave it empty, a block may have none at all
+    ball_rows = read_fields(ball_text, BALL_COLUMNS[1:] + ['restart'], comment=';').drop(columns='restart')
+    ball_rows.insert(0, 'frame_num', frame_nums)
+
+    return on_pitch(player_rows, metadata), on_pitch(ball_rows, metadata)
+
+
+def blocks(lines, size=BLOCK_LINES):
+    """
+    Groups a stream of lines into lists of at most size lines.
+    """
+    lines = iter(lines)
+    block = list(islice(lines, size))
+    while block:
+        yield block
+        block = list(islice(lines, size))
 
-                    if (0 < int(data[3]) < pitch['x']) and (0 < int(data[4]) < pitch['y']):
-                        # remove any frames that are outside the pitch borders
-                        player_frame = [frame_num, data[0], data[1], data[2], data[3], data[4], data[5]]
-                        player_data.append(player_frame)
+
+def categorize_data(filename, metadata=None, store=False):
+    """
+    splits the data into two CSV files: players and ball
+    :param filename: the name of the file to categorise, optionally compressed
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :param store: also write the tables to the columnar match store
+    :return: void
+    """
+    metadata = metadata or get_metadata()
+
+    player_data = []
+    ball_data = []
+
+    with open_file(filename, 'r') as file:
+        for block in blocks(file):
+            player_rows, ball_rows = categorize_lines(block, metadata)
+            player_data.append(player_rows)
+            ball_data.append(ball_rows)
 
     # Create directories if they don't exist
     output_directory = 'data'  # Change this to your desired output directory
     os.makedirs(output_directory, exist_ok=True)
 
     # add ball to CSV
-    ball_df = pd.DataFrame(ball_data, columns=['frame_num', 'x', 'y', 'z', 'speed', 'poss', 'inPlay'])
+    ball_df = pd.concat(ball_data, ignore_index=True) if ball_data else read_fields([], BALL_COLUMNS)
     # Save DataFrames to CSV files
     ball_df.to_csv(os.path.join(output_directory, 'ball.csv'), index=False)
 
     # add players to CSV
-    player_df = pd.DataFrame(player_data, columns=['frame_num', 'team_id', 'player_id', 'squadNum', 'x', 'y', 'speed'])
+    player_df = pd.concat(player_data, ignore_index=True) if player_data else read_fields([], PLAYER_COLUMNS)
     # Save DataFrames to CSV files
     player_df.to_csv(os.path.join(output_directory, 'player.csv'), index=False)
 
+    if store:
+        match_store.write_table(to_numeric_columns(ball_df), 'ball', source=os.path.join(output_directory, 'ball.csv'))
+        match_store.write_table(to_numeric_columns(player_df), 'player',
+                                source=os.path.join(output_directory, 'player.csv'))
+
+
+def to_numeric_columns(df):
+    """
+    Converts the text parsed from the .dat file into numbers, leaving the possession and in play flags as text.
+    :param df: DataFrame of player or ball rows
+    :return: DataFrame with typed columns
+    """
+    return df.apply(lambda column: column if column.name in ('poss', 'inPlay') else pd.to_numeric(column))
+
+
+def write_tables(batches, output_directory='data', store=False, compression=None):
+    """
+    Writes player and ball rows to player.csv and ball.csv as they are produced.
+    :param batches: iterable of (DataFrame of player rows, DataFrame of ball rows), as given by categorize_lines
+    :param output_directory: where player.csv and ball.csv are written
+    :param store: also write the tables to the columnar match store, under output_directory/store
+    :param compression: compression extension for the CSV files, e.g. '.gz' to write player.csv.gz
+    :return: number of player rows and ball rows written
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    player_filename = os.path.join(output_directory, 'player.csv' + (compression or ''))
+    ball_filename = os.path.join(output_directory, 'ball.csv' + (compression or ''))
+
+    player_count = 0
+    ball_count = 0
+
+    # the store is written from the same batches as the CSV files, rather than by reading them back
+    store_writers = None
+    if store:
+        store_directory = os.path.join(output_directory, 'store')
+        store_writers = (match_store.TableWriter('player', PLAYER_COLUMNS, store_directory),
+                         match_store.TableWriter('ball', BALL_COLUMNS, store_directory))
+
+    with open_file(player_filename, 'w', newline='') as player_file, \
+            open_file(ball_filename, 'w', newline='') as ball_file:
+        player_file.write(','.join(PLAYER_COLUMNS) + os.linesep)
+        ball_file.write(','.join(BALL_COLUMNS) + os.linesep)
+
+        for player_rows, ball_rows in batches:
+            # the line endings pandas uses when writing a whole table with to_csv
+            player_rows.to_csv(player_file, header=False, index=False, lineterminator=os.linesep)
+            ball_rows.to_csv(ball_file, header=False, index=False, lineterminator=os.linesep)
+            player_count += len(player_rows)
+            ball_count += len(ball_rows)
+
+            if store_writers:
+                store_writers[0].append(to_numeric_columns(player_rows))
+                store_writers[1].append(to_numeric_columns(ball_rows))
+
+    if store_writers:
+        store_writers[0].close(source=player_filename)
+        store_writers[1].close(source=ball_filename)
+
+    return player_count, ball_count
+
+
+def watch_states(lines, events_file):
+    """
+    Reads the match states of the lines as they go by, when the events are wanted.
+    :return: the lines, and the match_events.StateRuns gathering their states or None
+    """
+    if not events_file:
+        return lines, None
+    # imported here, match_events reads its lines with this module
+    import match_events
+    state_runs = match_events.StateRuns()
+    return state_runs.watch(lines), state_runs
+
+
+def stream_data(half1, half2, datafile, seconds=1, output_directory='data', metadata=None, store=False,
+                strategy='every_n', compression=None, events_file=None):
+    """
+    Single pass version of categorize_data(shorten_data(eliminate_noise(...))).
+    Each line is parsed once and written straight out, so no intermediate .dat files are produced
+    and memory use does not grow with the length of the match.
+    :param half1: Extracted metadata about the first half.
+    :param half2: Extracted metadata about the second half.
+    :param datafile: .dat file to be processed, optionally compressed (e.g. .dat.gz).
+    :param seconds: Real seconds per data capture.
+    :param output_directory: where player.csv and ball.csv are written
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :param store: also write the tables to the columnar match store, under output_directory/store
+    :param strategy: how each x seconds are reduced to one line, see downsample
+    :param compression: compression extension for the CSV files, e.g. '.gz'
+    :param events_file: also write the match events of every line in play here, gathered as the lines are read,
+    see match_events.StateRuns
+    :return: number of player rows and ball rows written
+    """
+    metadata = metadata or get_metadata()
+
+    lines, state_runs = watch_states(read_in_play(half1, half2, datafile), events_file)
+    lines = downsample(lines, seconds, strategy, metadata.frame_rate)
+    batches = (categorize_lines(block, metadata) for block in blocks(lines))
+    counts = write_tables(batches, output_directory, store, compression)
+    if state_runs:
+        state_runs.write(events_file)
+    return counts
+
+
+def chunk_ranges(datafile, chunks):
+    """
+    Splits a file into byte ranges that start and end on line boundaries.
+    :param datafile: file to split
+    :param chunks: number of ranges wanted
+    :return: list of (start, end) byte offsets, end exclusive
+    """
+    size = os.path.getsize(datafile)
+    boundaries = [0]
+
+    with open(datafile, 'rb') as file:
+        for k in range(1, chunks):
+            file.seek(size * k // chunks)
+            # move on to the start of the next line
+            file.readline()
+            boundaries.append(min(file.tell(), size))
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end]
+
+
+def read_range(datafile, start, end):
+    """
+    Streams the lines of a file within a byte range from chunk_ranges.
+    :param datafile: file to read
+    :param start: byte offset of the first line
+    :param end: byte offset after the last line
+    :return: Generator of the lines.
+    """
+    with open(datafile, 'rb') as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode()
+
+
+def is_in_play(frame, half1, half2):
+    return half1['start'] <= frame < half1['end'] or half2['start'] <= frame < half2['end']
+
+
+def in_play_lines(lines, half1, half2):
+    return (line for line in lines if is_in_play(line_frame(line), half1, half2))
+
+
+def count_in_play(job):
+    """
+    Counts the lines of a byte range that belong to active play. Run in a worker process.
+    :param job: (datafile, start, end, half1, half2)
+    :return: number of lines in play, frame of the first and of the last of them (None if there are none), and the
+    number of lines in the run of consecutive frames the range ends with
+    """
+    datafile, start, end, half1, half2 = job
+    count = run = 0
+    first_frame = last_frame = None
+    for line in in_play_lines(read_range(datafile, start, end), half1, half2):
+        frame = line_frame(line)
+        run = run + 1 if last_frame is not None and frame == last_frame + 1 else 1
+        first_frame = frame if first_frame is None else first_frame
+        last_frame = frame
+        count += 1
+    return count, first_frame, last_frame, run
+
+
+def run_positions(counts):
+    """
+    Finds how far into its run of consecutive frames the first line in play of each byte range is, which decides
+    where the windows of the downsampling fall in it, see frame_windows.
+    :param counts: count_in_play of each range, in order
+    :return: list of the number of lines of the run before each range
+    """
+    positions = []
+    position = 0
+    last_frame = None
+    for count, first_frame, range_last_frame, run in counts:
+        if first_frame is not None and (last_frame is None or first_frame != last_frame + 1):
+            position = 0
+        positions.append(position)
+        if first_frame is not None:
+            position = position + count if run == count else run
+            last_frame = range_last_frame
+    return positions
+
+
+def categorize_range(job):
+    """
+    Parses the lines of a byte range into player and ball rows. Run in a worker process.
+    :param job: (datafile, start, end, half1, half2, seconds, strategy, position, metadata, events), where position
+    is the number of lines of the run of consecutive frames before the range (see run_positions), so that
+    downsampling uses the same windows as a serial run, and events whether to gather the match states of the lines
+    in play of the range.
+    A range handles the windows starting in it, reading on into the next range to finish its last one.
+    :return: player rows, ball rows, and the match_events.StateRuns table of the range or None
+    """
+    datafile, start, end, half1, half2, seconds, strategy, position, metadata, events = job
+    n = frames_per_sample(seconds, metadata.frame_rate)
+
+    lines, state_runs = watch_states(in_play_lines(read_range(datafile, start, end), half1, half2), events)
+    following_lines = in_play_lines(read_range(datafile, end, os.path.getsize(datafile)), half1, half2)
+
+    # skipping the end of a window that started in an earlier range
+    finishing = (-position) % n
+    windows = list(frame_windows(lines, n, first=finishing))
+    if finishing and windows:
+        windows.pop(0)
+
+    # finishing the last window with the next range's lines, unless the frames stop being consecutive first
+    if windows and len(windows[-1]) < n:
+        for line in islice(following_lines, n - len(windows[-1])):
+            if line_frame(line) != line_frame(windows[-1][-1]) + 1:
+                break
+            windows[-1].append(line)
+
+    reduce_window = DOWNSAMPLING_STRATEGIES[strategy]
+    players, ball = categorize_lines([reduce_window(window) for window in windows], metadata)
+    return players, ball, state_runs.table() if state_runs else None
+
+
+def parallel_data(half1, half2, datafile, seconds=1, output_directory='data', metadata=None, store=False, workers=None,
+                  strategy='every_n', compression=None, events_file=None):
+    """
+    Parallel version of stream_data. The .dat file is split into line aligned byte ranges that are parsed in a
+    process pool, and the results are written out in frame order, so the output is the same as stream_data.
+    A compressed .dat file cannot be split without decompressing it from the start, so it is handed to stream_data.
+    :param half1: Extracted metadata about the first half.
+    :param half2: Extracted metadata about the second half.
+    :param datafile: .dat file to be processed.
+    :param seconds: Real seconds per data capture.
+    :param output_directory: where player.csv and ball.csv are written
+    :param metadata: MatchMetadata of the match, defaults to the loaded match
+    :param store: also write the tables to the columnar match store, under output_directory/store
+    :param workers: number of worker processes, defaults to the number of cores
+    :param strategy: how each x seconds are reduced to one line, see downsample
+    :param compression: compression extension for the CSV files, e.g. '.gz'
+    :param events_file: also write the match events of every line in play here, see stream_data
+    :return: number of player rows and ball rows written
+    """
+    metadata = metadata or get_metadata()
+    if compression_of(datafile):
+        return stream_data(half1, half2, datafile, seconds, output_directory, metadata, store, strategy, compression,
+                           events_file)
+    workers = workers or os.cpu_count()
+
+    # a few ranges per worker keeps them all busy until the end
+    ranges = chunk_ranges(datafile, workers * 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # the lines in play before each range decide which of its lines are kept by the downsampling
+        counts = list(pool.map(count_in_play, [(datafile, start, end, half1, half2) for start, end in ranges]))
+
+        jobs = [(datafile, start, end, half1, half2, seconds, strategy, position, metadata, bool(events_file))
+                for (start, end), position in zip(ranges, run_positions(counts))]
+
+        # map returns the results in the order of the ranges, i.e. frame order
+        state_tables = []
+
+        def batches():
+            for players, ball, states in pool.map(categorize_range, jobs):
+                state_tables.append(states)
+                yield players, ball
+
+        counts = write_tables(batches(), output_directory, store, compression)
+
+    if events_file:
+        import match_events
+        match_events.StateRuns(state_tables).write(events_file)
+    return counts
 
-# clean up file
-categorize_data(shorten_data(1, eliminate_noise(first_half, second_half, 'C:\\Users\\mrmbe\\fyp\\data\\gamedata\\987632.dat')))
 
+if __name__ == "__main__":
+    # clean up file, skipping it when the data and parameters have not changed since the last run
+    import preprocess_cache
+    preprocess_cache.preprocess('C:\\Users\\mrmbe\\fyp\\data\\gamedata\\987632.dat', store=True)
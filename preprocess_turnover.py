@@ -1,12 +1,22 @@
 import re
 
+import numpy as np
+import pandas as pd
+
+from fileio import open_file
+from preprocess_data import blocks
+from turnovers import RESTART, detect_turnovers
+
+# format at the end: ":<misc_numbers>,<possession>,<status>;"
+STATE_PATTERN = r":.*?,(A|H),(Alive|Dead)(?:,(?:SetAway|SetHome|Whistle|B4))?;:$"
+
 
 def parse_line(line):
     """
     Extracts possession, status and action from line.
     format at the end: ":<misc_numbers>,<possession>,<status>;"
     """
-    match = re.search(r":.*?,(A|H),(Alive|Dead)(?:,(SetAway|SetHome|Whistle|B4))?;:$", line)
+    match = re.search(STATE_PATTERN, line)
     if match:
         possession = match.group(1)
         status = match.group(2)
@@ -17,33 +27,44 @@ def parse_line(line):
 
 
 def process_file(input_path):
-    last_possession, last_status = None, None
     transitions = {'A_to_H': [], 'H_to_A': []}  # To store lines where transitions occur
 
+    # possession and status of the last line of the block before, so turnovers across blocks are found too
+    last_state = None
+
     try:
-        with open(input_path, 'r') as infile, \
+        with open_file(input_path, 'r') as infile, \
                 open('data/home_team_turnover.dat', 'w') as home_out, \
                 open('data/away_team_turnover.dat', 'w') as away_out:
 
-            for line in infile:
-                possession, status = parse_line(line.strip())
-                if not possession or not status:
+            for block in blocks(infile):
+                # possession and status of every line of the block at once, lines without them are left out
+                lines = pd.Series(block, dtype=object)
+                states = lines.str.rstrip().str.extract(STATE_PATTERN)
+                for line in lines[states[0].isna()]:
                     print(f"Failed to match line: {line.strip()}")
+                states = states.dropna()
+                if states.empty:
+                    continue
+
+                poss = states[0].to_numpy()
+                status = states[1].to_numpy()
+                if last_state is not None:
+                    poss = np.concatenate(([last_state[0]], poss))
+                    status = np.concatenate(([last_state[1]], status))
+
+                # ball back into play with possession changed
+                found = detect_turnovers(np.arange(len(poss)), poss, status, kinds=(RESTART,))
+                rows = found['row'].to_numpy() - (last_state is not None)
+                last_state = (poss[-1], status[-1])
 
-                # Check for valid data and transition logic
-                if possession and status:  # Ensure they are not None
-                    # Detecting transitions based on status change and possession change
-                    if last_status == "Dead" and status == "Alive" and last_possession != possession:
-                        # Log the transition based on possession changing.
-                        if last_possession == "A" and possession == "H":
-                            transitions['A_to_H'].append(line)
-                            home_out.write(line)
-                        elif last_possession == "H" and possession == "A":
-                            transitions['H_to_A'].append(line)
-                            away_out.write(line)
-
-                    # Update last known states
-                    last_possession, last_status = possession, status
+                for line, possession in zip(lines[states.index[rows]], found['poss']):
+                    if possession == 'H':
+                        transitions['A_to_H'].append(line)
+                        home_out.write(line)
+                    else:
+                        transitions['H_to_A'].append(line)
+                        away_out.write(line)
 
     except IOError as e:
         print(f"An error occurred while processing the file: {e}")
@@ -51,7 +72,8 @@ def process_file(input_path):
     return transitions
 
 
-input_path = 'data/gamedata/in_play.dat'
-transitions = process_file(input_path)
-print("Transitions from Away to Home:", len(transitions['A_to_H']))
-print("Transitions from Home to Away:", len(transitions['H_to_A']))
+if __name__ == "__main__":
+    input_path = 'data/gamedata/in_play.dat'
+    transitions = process_file(input_path)
+    print("Transitions from Away to Home:", len(transitions['A_to_H']))
+    print("Transitions from Home to Away:", len(transitions['H_to_A']))
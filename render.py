@@ -0,0 +1,176 @@
+# Renders figures in a pool of worker processes. Drawing and saving a figure takes far longer than preparing its data,
+# so the analyses only prepare the data of each figure and hand it over as a job, and the workers draw them with the
+# headless Agg backend, many at a time. Jobs name their drawing function (e.g. "plots.five_v_five_frame") rather than
+# passing it, so the analyses themselves never import Matplotlib.
+# Rendered figures are kept in a cache keyed by a hash of their arguments and of the drawing code, so running an
+# analysis again only draws the figures whose data or parameters changed. The least recently used figures are evicted
+# once the cache grows past RENDER_CACHE_SIZE.
+import hashlib
+import importlib
+import importlib.util
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# number of worker processes, None for one per core
+RENDER_WORKERS = None
+
+# format of the clips of turnover lead-ups, by extension (see plots.write_clip), and frames shown per second
+CLIP_EXTENSION = '.gif'
+CLIP_FPS = 2
+
+RENDER_CACHE = 'data/render_cache'
+# bytes of figures kept in the cache
+RENDER_CACHE_SIZE = 2 << 30
+
+
+def use_agg():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def resolve(draw):
+    """
+    :param draw: name of a drawing function, as "module.function"
+    :return: the function
+    """
+    module, name = draw.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
+
+
+def render_job(job):
+    """
+    Draws and saves one figure. Run in a worker process.
+    :param job: (name of the drawing function, dictionary of its arguments, including the filename to save to)
+    :return: the filename of the figure
+    """
+    draw, arguments = job
+    resolve(draw)(**arguments)
+    return arguments['filename']
+
+
+def draw_figures(draw, jobs, workers):
+    """
+    Draws and saves figures, in this process with one worker, otherwise in a pool of Agg workers.
+    """
+    workers = min(workers or os.cpu_count(), len(jobs))
+    if workers <= 1:
+        use_agg()
+        return [render_job((draw, job)) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=use_agg) as pool:
+        # a few jobs per task keeps the overhead of handing them over low, while still sharing them out evenly
+        chunksize = max(1, len(jobs) // (workers * 4))
+        return list(pool.map(render_job, [(draw, job) for job in jobs], chunksize=chunksize))
+
+
+def update_digest(digest, value):
+    """
+    Feeds an argument of a drawing function into a hash: arrays and tables by their contents, containers item by
+    item, anything else by its repr.
+    """
+    digest.update(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr([(str(column), str(dtype)) for column, dtype in value.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        update_digest(digest, value.to_frame())
+    elif isinstance(value, np.ndarray):
+        digest.update(f'{value.dtype.str}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        for key in sorted(value, key=repr):
+            digest.update(repr(key).encode())
+            update_digest(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(str(len(value)).encode())
+        for item in value:
+            update_digest(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+def source_hash(draw):
+    """
+    :return: hash of the source of the module of a drawing function, so figures are drawn again when it changes
+    """
+    with open(importlib.util.find_spec(draw.rsplit('.', 1)[0]).origin, 'rb') as file:
+        return hashlib.blake2b(file.read()).hexdigest()
+
+
+def figure_key(draw, source, job):
+    """
+    :param draw: name of the drawing function
+    :param source: source_hash of the drawing function
+    :param job: arguments of the figure
+    :return: hex digest of everything the figure is drawn from, its filename aside
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(draw.encode())
+    digest.update(source.encode())
+    update_digest(digest, {name: value for name, value in job.items() if name != 'filename'})
+    return digest.hexdigest()
+
+
+def evict(cache, cache_size):
+    """
+    Removes the least recently used figures from the cache until it holds at most cache_size bytes.
+    Figures are marked as used by their modification time.
+    """
+    entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                     for entry in os.scandir(cache) if entry.is_file())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= cache_size:
+            break
+        os.remove(path)
+        total -= size
+
+
+def render_figures(draw, jobs, workers=RENDER_WORKERS, cache=RENDER_CACHE, cache_size=RENDER_CACHE_SIZE):
+    """
+    Renders a set of figures with the same drawing function. Figures already in the cache are copied from it rather
+    than drawn again.
+    :param draw: name of the drawing function, as "module.function". It takes the arguments of a job and saves the
+    figure to the job's filename.
+    :param jobs: list of dictionaries of arguments, one per figure, each with the filename to save the figure to
+    :param workers: number of worker processes, defaults to one per core. With 1 the figures are drawn in this process.
+    :param cache: directory of the render cache, None to draw every figure
+    :param cache_size: bytes of figures kept in the cache
+    :return: the filenames of the figures, in the order of the jobs
+    """
+    if not jobs:
+        return []
+    for directory in {os.path.dirname(job['filename']) for job in jobs}:
+        os.makedirs(directory or '.', exist_ok=True)
+
+    if cache is None:
+        return draw_figures(draw, jobs, workers)
+
+    os.makedirs(cache, exist_ok=True)
+    source = source_hash(draw)
+    cached = [os.path.join(cache, figure_key(draw, source, job) + os.path.splitext(job['filename'])[1])
+              for job in jobs]
+
+    # figures missing from the cache are drawn to a temporary name first, so an interrupted run leaves no partial
+    # figure behind under its key
+    missing = {}
+    for job, filename in zip(jobs, cached):
+        if filename not in missing and not os.path.exists(filename):
+            stem, extension = os.path.splitext(filename)
+            missing[filename] = dict(job, filename=f'{stem}.partial{extension}')
+    if missing:
+        draw_figures(draw, list(missing.values()), workers)
+    for filename, job in missing.items():
+        os.replace(job['filename'], filename)
+
+    for job, filename in zip(jobs, cached):
+        os.utime(filename)
+        shutil.copyfile(filename, job['filename'])
+
+    evict(cache, cache_size)
+    print(f"Drew {len(missing)} figures, {len(jobs) - len(missing)} from the render cache")
+    return [job['filename'] for job in jobs]
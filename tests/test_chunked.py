@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import chunked
+from player_and_ball import merge_player_and_ball
+
+
+def write_tables(directory, player_frames, ball_frames):
+    """
+    Writes a player.csv with two players in each of player_frames and a ball.csv with the ball in each of ball_frames.
+    """
+    players = pd.DataFrame({"frame_num": np.repeat(player_frames, 2), "team_id": np.tile([0, 1], len(player_frames)),
+                            "player_id": np.tile([1, 12], len(player_frames)),
+                            "squadNum": np.tile([1, 2], len(player_frames)),
+                            "x": np.arange(2 * len(player_frames)) % 100, "y": 10, "speed": 1.5})
+    ball = pd.DataFrame({"frame_num": ball_frames, "x": 50, "y": 30, "z": 0.1, "speed": 2.5, "poss": "H",
+                         "inPlay": "Alive"})
+    players.to_csv(directory / "player.csv", index=False)
+    ball.to_csv(directory / "ball.csv", index=False)
+    return players, ball
+
+
+def test_join_when_the_ball_table_ends_before_the_player_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    players, ball = write_tables(tmp_path, np.arange(100, 600), np.arange(100, 400))
+
+    for memory_budget in (chunked.MEMORY_BUDGET, 20000):
+        rows = chunked.join_player_and_ball(str(tmp_path / "joined.csv"), str(tmp_path / "player.csv"),
+                                            str(tmp_path / "ball.csv"), memory_budget=memory_budget)
+
+        joined = pd.read_csv(tmp_path / "joined.csv")
+        expected = merge_player_and_ball(players, ball)
+        assert rows == len(expected) == 600
+        assert joined["frame_num"].tolist() == expected["frame_num"].tolist()
+        assert joined["x_player"].tolist() == expected["x_player"].tolist()
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import preprocess_data
+
+# line_player_v_player reads the pitch size when imported, so the metadata is given before it is
+preprocess_data._loaded_metadata.setdefault(preprocess_data.METADATA_FILE, preprocess_data.MatchMetadata(
+    {'x': 105.0, 'y': 68.0}, {'x': 111.0, 'y': 88.0}, {'start': 0, 'end': 1000}, {'start': 2000, 'end': 3000}))
+
+import line_player_v_player  # noqa: E402
+
+
+def player_and_ball(frames, players=3):
+    """
+    A player_and_ball table of the frames, with each team's players moving across the pitch.
+    """
+    rng = np.random.default_rng(0)
+    rows = []
+    for frame in frames:
+        for team_id in (0, 1):
+            for squad_num in range(1, players + 1):
+                rows.append({"frame_num": frame, "team_id": team_id, "player_id": team_id * 100 + squad_num,
+                             "squadNum": squad_num, "x_player": rng.uniform(0, 105), "y_player": rng.uniform(0, 68),
+                             "x_ball": 52.5, "y_ball": 34.0, "poss": "H", "inPlay": "Alive"})
+    return pd.DataFrame(rows)
+
+
+def test_lead_up_clip_has_the_frames_before_the_turnover():
+    data = player_and_ball(range(0, 1000, 25))
+
+    lead_ups = line_player_v_player.lead_up_closeness(data, [500], lead=125, step=25)
+
+    assert len(lead_ups) == 1
+    turnover, frames = lead_ups[0]
+    assert turnover == 500
+    assert len(frames) > 1
+    assert [frame for frame, _, _ in frames] == [375, 400, 425, 450, 475, 500]
+    for frame, pairs, mean_distance in frames:
+        assert (pairs["frame_num"] == frame).all()
+        assert mean_distance == pairs["distance"].mean()
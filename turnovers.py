@@ -0,0 +1,128 @@
+# Possession turnovers, found once from the ball table and kept in data/turnovers.csv for every analysis to use.
+# A turnover is a frame where possession is with the other team than in the frame before it, either
+#   restart: the ball was dead and is brought back into play by the other team, or
+#   live: the ball stays in play while possession changes.
+import os
+import numpy as np
+import pandas as pd
+
+import match_store
+from fileio import find_file
+
+RESTART = 'restart'
+LIVE = 'live'
+KINDS = (RESTART, LIVE)
+
+TURNOVER_FILE = 'data/turnovers.csv'
+
+# seconds of play before a turnover that make up its lead-up
+LEAD_SECONDS = 5
+
+
+def detect_turnovers(frame_num, poss, in_play, kinds=KINDS):
+    """
+    Finds the turnovers in a frame ordered sequence of possession and in play flags by comparing it with itself
+    shifted by one frame.
+    :param frame_num: frame numbers
+    :param poss: team in possession of each frame, 'H' or 'A'
+    :param in_play: in play status of each frame, 'Alive' or 'Dead'
+    :param kinds: which kinds of turnover to find
+    :return: DataFrame of the turnovers with columns frame_num, row (position in the sequence), kind,
+    previous_poss and poss
+    """
+    poss = np.asarray(poss).astype(str)
+    alive = np.asarray(in_play).astype(str) == 'Alive'
+
+    changed = np.zeros(len(poss), dtype=bool)
+    changed[1:] = poss[1:] != poss[:-1]
+    was_alive = np.zeros(len(poss), dtype=bool)
+    was_alive[1:] = alive[:-1]
+    was_dead = np.zeros(len(poss), dtype=bool)
+    was_dead[1:] = ~alive[:-1]
+
+    kind = np.full(len(poss), '', dtype=object)
+    if RESTART in kinds:
+        kind[changed & alive & was_dead] = RESTART
+    if LIVE in kinds:
+        kind[changed & alive & was_alive] = LIVE
+
+    rows = np.flatnonzero(kind != '')
+    return pd.DataFrame({'frame_num': np.asarray(frame_num)[rows], 'row': rows, 'kind': kind[rows],
+                         'previous_poss': poss[rows - 1], 'poss': poss[rows]})
+
+
+def write_turnover_index(output_file=TURNOVER_FILE):
+    """
+    Finds the turnovers of the loaded match from its ball table and writes them to a CSV file.
+    :return: number of turnovers
+    """
+    ball = match_store.load_table('ball', columns=['frame_num', 'poss', 'inPlay'])
+    index = detect_turnovers(ball['frame_num'], ball['poss'], ball['inPlay'])
+    index.to_csv(output_file, index=False)
+    return len(index)
+
+
+def load_turnover_index(kind=None, filename=TURNOVER_FILE):
+    """
+    Loads the turnovers of the loaded match, finding them first if they have not been written since the ball table
+    last changed.
+    :param kind: only the turnovers of this kind, RESTART or LIVE, defaults to both
+    :param filename: where the turnovers are kept
+    :return: DataFrame, see detect_turnovers
+    """
+    ball_file = find_file(os.path.join(match_store.CSV_DIRECTORY, 'ball.csv'))
+    if not os.path.exists(filename) or \
+            (os.path.exists(ball_file) and os.path.getmtime(ball_file) > os.path.getmtime(filename)):
+        write_turnover_index(filename)
+
+    index = pd.read_csv(filename)
+    return index if kind is None else index[index['kind'] == kind].reset_index(drop=True)
+
+
+def turnover_rows(data, kind=None, index=None):
+    """
+    Selects the first row of every turnover frame from a match table, e.g. player_and_ball.
+    :param data: frame ordered DataFrame with a frame_num column
+    :param kind: only the turnovers of this kind, RESTART or LIVE, defaults to both
+    :param index: turnovers to select, defaults to load_turnover_index(kind)
+    :return: DataFrame of the selected rows
+    """
+    index = load_turnover_index(kind) if index is None else index
+    first_rows = ~data['frame_num'].duplicated()
+    return data[first_rows & data['frame_num'].isin(index['frame_num'])]
+
+
+def lead_up(frame_nums, turnover_frames, lead):
+    """
+    Finds the turnover each frame leads up to: the first turnover at or after the frame, at most lead frames later.
+    :param frame_nums: frame numbers
+    :param turnover_frames: frame numbers of the turnovers
+    :param lead: frames before a turnover that lead up to it
+    :return: array of the turnover frame of each frame, -1 for frames that lead up to none
+    """
+    frame_nums = np.asarray(frame_nums, dtype=np.int64)
+    turnover_frames = np.sort(np.asarray(turnover_frames, dtype=np.int64))
+    if not len(turnover_frames):
+        return np.full(len(frame_nums), -1, dtype=np.int64)
+
+    following = np.searchsorted(turnover_frames, frame_nums, side='left')
+    turnover = turnover_frames[np.minimum(following, len(turnover_frames) - 1)]
+    leads = (following < len(turnover_frames)) & (turnover - frame_nums <= lead)
+    return np.where(leads, turnover, -1)
+
+
+def lead_up_frames(frame_nums, turnover_frame, lead, step):
+    """
+    Picks the frames leading up to a turnover: the last frame at or before the turnover and at or before every step
+    frames back from it, going back at most lead frames.
+    :param frame_nums: sorted frame numbers of the match, each once
+    :param turnover_frame: frame number of the turnover
+    :param lead: frames before the turnover that lead up to it
+    :param step: frames between the frames picked
+    :return: array of the frames picked, in match order
+    """
+    frame_nums = np.asarray(frame_nums, dtype=np.int64)
+    targets = turnover_frame - np.arange(0, lead + 1, step)[::-1]
+    rows = np.searchsorted(frame_nums, targets, side='right') - 1
+    picked = frame_nums[np.unique(rows[rows >= 0])]
+    return picked[picked >= turnover_frame - lead]